@@ -1,4 +1,4 @@
-from time import sleep
+from time import sleep, perf_counter
 
 
 class Adafruit_CharLCD(object):
@@ -45,6 +45,13 @@ class Adafruit_CharLCD(object):
     LCD_5x10DOTS            = 0x04
     LCD_5x8DOTS             = 0x00
 
+    # HD44780 execution times in microseconds (datasheet values plus margin)
+    EXEC_TIME_DEFAULT       = 40    # most commands, including set DDRAM address
+    EXEC_TIME_DATA          = 45    # data write: 37us + 4us address update
+    EXEC_TIME_CLEAR         = 1600  # clear display / return home: 1.52ms
+    EXEC_TIME_INIT          = 4100  # first function set after power-on
+    SPIN_THRESHOLD          = 200   # waits shorter than this spin, sleep() overshoots them
+
     def __init__(self, pin_rs=25, pin_e=24, pins_db=[23, 17, 21, 22], GPIO=None):
         # Emulate the old behavior of using RPi.GPIO if we haven't been given
         # an explicit GPIO interface to use
@@ -63,11 +70,20 @@ class Adafruit_CharLCD(object):
         for pin in self.pins_db:
             self.GPIO.setup(pin, GPIO.OUT)
 
-        self.write4bits(0x33)  # initialization
-        self.write4bits(0x32)  # initialization
-        self.write4bits(0x28)  # 2 line 5x7 matrix
-        self.write4bits(0x0C)  # turn cursor off 0x0E to enable cursor
-        self.write4bits(0x06)  # shift cursor right
+        # I2C backpacks can take whole nibble sequences in one bus transaction
+        self.fast_write = getattr(self.GPIO, 'writeLCD', None)
+        if self.fast_write:
+            self.GPIO.setupLCD(self.pin_rs, self.pin_e, self.pins_db)
+        # ... and coalesce a whole render into one of them
+        self.batch = getattr(self.GPIO, 'batchLCD', None)
+        self.batching = False
+
+        self.numcols = 16
+        self.numlines = 2
+        self.shadow = None      # what is on the glass, None when unknown
+        self.cursor_pos = None  # (col, row) of the DDRAM address counter
+        self.ready_at = 0.0     # perf_counter() time the controller is free again
+        self.needs_init = False # a transfer failed part way, resync before the next render
 
         self.displaycontrol = self.LCD_DISPLAYON | self.LCD_CURSOROFF | self.LCD_BLINKOFF
 
@@ -76,28 +92,43 @@ class Adafruit_CharLCD(object):
 
         # Initialize to default text direction (for romance languages)
         self.displaymode = self.LCD_ENTRYLEFT | self.LCD_ENTRYSHIFTDECREMENT
-        self.write4bits(self.LCD_ENTRYMODESET | self.displaymode)  # set the entry mode
 
+        self.initialize()
+
+    def initialize(self):
+        """ Enter 4-bit mode and clear the display. The 0x33, 0x32 sequence
+        also resynchronizes a controller left half way through a byte """
+        self.write4bits(0x33)  # initialization
+        self.busy(self.EXEC_TIME_INIT)
+        self.write4bits(0x32)  # initialization
+        self.write4bits(0x28)  # 2 line 5x7 matrix
+        self.write4bits(0x0C)  # turn cursor off 0x0E to enable cursor
+        self.write4bits(0x06)  # shift cursor right
+        self.write4bits(self.LCD_ENTRYMODESET | self.displaymode)  # set the entry mode
         self.clear()
 
     def begin(self, cols, lines):
+        self.numcols = cols
         if (lines > 1):
             self.numlines = lines
             self.displayfunction |= self.LCD_2LINE
+        self.shadow = [[' '] * self.numcols for _ in range(self.numlines)]
 
     def home(self):
-        self.write4bits(self.LCD_RETURNHOME)  # set cursor position to zero
-        self.delayMicroseconds(3000)  # this command takes a long time!
+        self.write4bits(self.LCD_RETURNHOME)  # set cursor position to zero, this command takes a long time!
+        self.cursor_pos = (0, 0)
 
     def clear(self):
-        self.write4bits(self.LCD_CLEARDISPLAY)  # command to clear display
-        self.delayMicroseconds(3000)  # 3000 microsecond sleep, clearing the display takes a long time
+        self.write4bits(self.LCD_CLEARDISPLAY)  # command to clear display, clearing the display takes a long time
+        self.shadow = [[' '] * self.numcols for _ in range(self.numlines)]
+        self.cursor_pos = (0, 0)
 
     def setCursor(self, col, row):
         self.row_offsets = [0x00, 0x40, 0x14, 0x54]
         if row > self.numlines:
             row = self.numlines - 1  # we count rows starting w/0
         self.write4bits(self.LCD_SETDDRAMADDR | (col + self.row_offsets[row]))
+        self.cursor_pos = (col, row)
 
     def noDisplay(self):
         """ Turn the display off (quickly) """
@@ -157,9 +188,39 @@ class Adafruit_CharLCD(object):
         self.displaymode &= ~self.LCD_ENTRYSHIFTINCREMENT
         self.write4bits(self.LCD_ENTRYMODESET | self.displaymode)
 
+    def execTime(self, bits, char_mode):
+        """ Microseconds the controller needs to execute this byte """
+        if char_mode:
+            return self.EXEC_TIME_DATA
+        if bits in (self.LCD_CLEARDISPLAY, self.LCD_RETURNHOME, self.LCD_RETURNHOME | 1):
+            return self.EXEC_TIME_CLEAR
+        return self.EXEC_TIME_DEFAULT
+
+    def busy(self, microseconds):
+        """ Mark the controller busy for at least microseconds from now """
+        self.ready_at = max(self.ready_at, perf_counter() + microseconds / 1000000.0)
+
+    def waitReady(self):
+        """ Wait until the previous command has finished executing. Time already
+        spent elsewhere (bus latency, rendering) counts, so usually there is no wait """
+        if self.batching:
+            return  # queued bytes go out back to back; each one's bus time covers the last one's execution
+        remaining = self.ready_at - perf_counter()
+        if remaining <= 0:
+            return
+        if remaining * 1000000 > self.SPIN_THRESHOLD:
+            sleep(remaining - self.SPIN_THRESHOLD / 1000000.0)
+        while perf_counter() < self.ready_at:
+            pass
+
     def write4bits(self, bits, char_mode=False):
         """ Send command to LCD """
-        self.delayMicroseconds(1000)  # 1000 microsecond sleep
+        self.waitReady()
+        if self.fast_write:
+            self.fast_write((bits,), char_mode)
+            self.busy(self.execTime(bits, char_mode))
+            return
+        exec_time = self.execTime(bits, char_mode)
         bits = bin(bits)[2:].zfill(8)
         self.GPIO.output(self.pin_rs, char_mode)
         for pin in self.pins_db:
@@ -174,26 +235,93 @@ class Adafruit_CharLCD(object):
             if bits[i] == "1":
                 self.GPIO.output(self.pins_db[::-1][i-4], True)
         self.pulseEnable()
+        self.busy(exec_time)
 
     def delayMicroseconds(self, microseconds):
         seconds = microseconds / float(1000000)  # divide microseconds by 1 million for seconds
         sleep(seconds)
 
     def pulseEnable(self):
+        # Each GPIO.output call takes well over the 450ns the enable pulse needs,
+        # and command settle time is handled by waitReady(), so no sleeps here
         self.GPIO.output(self.pin_e, False)
-        self.delayMicroseconds(1)       # 1 microsecond pause - enable pulse must be > 450ns
         self.GPIO.output(self.pin_e, True)
-        self.delayMicroseconds(1)       # 1 microsecond pause - enable pulse must be > 450ns
         self.GPIO.output(self.pin_e, False)
-        self.delayMicroseconds(1)       # commands need > 37us to settle
+
+    def writeData(self, data):
+        """ Send a run of character bytes, batched into one transfer when possible """
+        if not data:
+            return
+        if self.fast_write:
+            # each byte spends six port writes (>130us even at 400kHz) on the
+            # bus, longer than a data write takes to execute, so only the
+            # first byte can need to wait
+            self.waitReady()
+            self.fast_write(data, True)
+            self.busy(self.EXEC_TIME_DATA)
+        else:
+            for value in data:
+                self.write4bits(value, True)
 
     def message(self, text):
         """ Send string to LCD. Newline wraps to second line"""
-        for char in text:
-            if char == '\n':
+        # Writes outside render() are not tracked, so the next render redraws everything
+        self.shadow = None
+        self.cursor_pos = None
+        for i, line in enumerate(text.split('\n')):
+            if i:
                 self.write4bits(0xC0)  # next line
-            else:
-                self.write4bits(ord(char), True)
+            self.writeData(line.encode('latin-1', 'replace'))
+
+    def render(self, lines):
+        """ Show lines on the LCD, sending only the cells that differ from the shadow buffer.
+        Returns the number of cells written; 0 means no bus traffic at all """
+        if self.needs_init:
+            self.initialize()
+            self.needs_init = False
+        if self.shadow is None:
+            self.shadow = [[None] * self.numcols for _ in range(self.numlines)]
+        try:
+            if not self.batch:
+                return self._render(lines)
+            # Cursor moves and data only (no clear/home), so nothing in the
+            # stream needs more time than the bytes after it take on the bus
+            self.waitReady()
+            with self.batch():
+                self.batching = True
+                try:
+                    written = self._render(lines)
+                finally:
+                    self.batching = False
+            self.busy(self.EXEC_TIME_DATA)  # the stream ended just now
+            return written
+        except Exception:
+            # Part of the transfer may have reached the controller: forget what is
+            # on the glass and where the cursor is, and resync on the next render
+            self.shadow = None
+            self.cursor_pos = None
+            self.needs_init = True
+            raise
+
+    def _render(self, lines):
+        written = 0
+        for row, text in enumerate(lines[:self.numlines]):
+            text = text[:self.numcols].ljust(self.numcols)
+            shadow = self.shadow[row]
+            run = bytearray()
+            for col, char in enumerate(text):
+                if shadow[col] == char:
+                    continue
+                if self.cursor_pos != (col, row):
+                    self.writeData(run)
+                    run = bytearray()
+                    self.setCursor(col, row)
+                run += char.encode('latin-1', 'replace')
+                shadow[col] = char
+                self.cursor_pos = (col + 1, row)  # address counter auto-increments
+                written += 1
+            self.writeData(run)
+        return written
 
 
 if __name__ == '__main__':
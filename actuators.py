@@ -0,0 +1,130 @@
+from time import time
+
+# Patterns are sequences of (state, seconds) steps
+PATTERNS = {
+    'beep': ((True, 0.1),),
+    'chirp': ((True, 0.05), (False, 0.05), (True, 0.05)),
+    'siren': ((True, 0.4), (False, 0.1)) * 4,
+    'blink': ((True, 0.5), (False, 0.5)),
+    'blink_fast': ((True, 0.1), (False, 0.1)),
+}
+
+
+class ActuatorScheduler(object):
+    """Plays buzzer/LED patterns from a hashed timer wheel without sleeping.
+
+    The owner calls tick() from its loop; due pattern steps are applied and
+    the next step is scheduled. The last written level of every pin is cached
+    so GPIO.output() only happens when a pin actually changes.
+    """
+
+    def __init__(self, GPIO, resolution=0.01, wheel_size=512):
+        self.GPIO = GPIO
+        self.resolution = resolution
+        self.wheel_size = wheel_size
+        self.wheel = [[] for _ in range(wheel_size)]
+        self.states = {}
+        self.active = {}
+        self.pending = 0
+        self.writes = 0
+        self._generation = 0
+        self._current = self._tick_of(time())
+
+    def _tick_of(self, t):
+        return int(t / self.resolution)
+
+    def reset(self):
+        """Forget cached pin levels and cancel all patterns (e.g. after GPIO setup)"""
+        self.states.clear()
+        self.active.clear()
+        for slot in self.wheel:
+            slot.clear()
+        self.pending = 0
+
+    def write(self, pin, state, force=False):
+        state = bool(state)
+        if not force and self.states.get(pin) is state:
+            return False
+        self.GPIO.output(pin, self.GPIO.HIGH if state else self.GPIO.LOW)
+        self.states[pin] = state
+        self.writes += 1
+        return True
+
+    def set(self, pin, state):
+        """Drive a pin to a steady level, cancelling any pattern on it"""
+        self.active.pop(pin, None)
+        return self.write(pin, state)
+
+    def is_playing(self, pin):
+        return pin in self.active
+
+    def play(self, pin, pattern, repeat=False, now=None):
+        steps = PATTERNS[pattern] if isinstance(pattern, str) else tuple(pattern)
+        if not steps:
+            raise ValueError("Pattern must have at least one step")
+        self._generation += 1
+        self.active[pin] = (self._generation, steps, repeat)
+        self._run_step(pin, self._generation, 0, time() if now is None else now)
+
+    def stop(self, pin, state=False):
+        self.set(pin, state)
+
+    def _run_step(self, pin, generation, index, now):
+        entry = self.active.get(pin)
+        if entry is None or entry[0] != generation:
+            return  # pattern was replaced or cancelled
+        _, steps, repeat = entry
+        if index >= len(steps):
+            if not repeat:
+                del self.active[pin]
+                self.write(pin, False)
+                return
+            index = 0
+        state, duration = steps[index]
+        self.write(pin, state)
+        self._schedule(now + duration, (pin, generation, index + 1))
+
+    def _schedule(self, deadline, item):
+        tick = max(self._tick_of(deadline), self._current + 1)
+        self.wheel[tick % self.wheel_size].append((tick, item))
+        self.pending += 1
+
+    def tick(self, now=None):
+        if now is None:
+            now = time()
+        target = self._tick_of(now)
+        if target <= self._current:
+            return
+        if not self.pending:
+            self._current = target
+            return
+        if target - self._current >= self.wheel_size:
+            # Fell behind by a full revolution; every slot may hold due entries
+            slots = range(self.wheel_size)
+        else:
+            slots = range(self._current + 1, target + 1)
+        self._current = target
+        for index in slots:
+            slot = self.wheel[index % self.wheel_size]
+            if not slot:
+                continue
+            due = [entry for entry in slot if entry[0] <= target]
+            if not due:
+                continue
+            slot[:] = [entry for entry in slot if entry[0] > target]
+            self.pending -= len(due)
+            for _, (pin, generation, step) in due:
+                self._run_step(pin, generation, step, now)
+
+    def time_to_next(self, now=None):
+        """Seconds until the next scheduled step, or None when idle"""
+        if not self.pending:
+            return None
+        if now is None:
+            now = time()
+        for offset in range(1, self.wheel_size + 1):
+            tick = self._current + offset
+            for entry_tick, _ in self.wheel[tick % self.wheel_size]:
+                if entry_tick == tick:
+                    return max(0.0, tick * self.resolution - now)
+        return self.wheel_size * self.resolution
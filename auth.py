@@ -1,13 +1,200 @@
 from functools import wraps
-from flask import request, Response
-from werkzeug.security import generate_password_hash, check_password_hash
+from collections import OrderedDict
+import base64
+import hashlib
+import hmac
+import os
+import sys
+import threading
+from time import monotonic, time
+from flask import request, Response, g, jsonify, make_response
+from werkzeug.security import check_password_hash
 from config import Config
+from metrics import PASSWORD_HASHES, registry
+from profiling import stage_timers
+from ratelimit import SlidingWindowLimiter
+from url_signing import verify_capture_signature
 
-def check_auth(username, password):
-    """Check if username/password combination is valid"""
-    if username not in Config.USERS:
+class CredentialCache:
+    """Bounded LRU+TTL cache of successful password verifications.
+
+    Entries are keyed by an HMAC of username+password under a per-process
+    random key, so neither the plaintext nor a reusable hash is kept. The
+    cache empties itself whenever Config.USERS changes.
+    """
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._users = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _digest(self, username, password):
+        message = f"{len(username)}:{username}{password}".encode('utf-8')
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def _sync_users(self, users):
+        fingerprint = tuple(sorted(users.items()))
+        if fingerprint != self._users:
+            self._entries.clear()
+            self._users = fingerprint
+
+    def check(self, username, password, users):
+        """True if this pair was verified recently, None if it must be verified"""
+        digest = self._digest(username, password)
+        now = monotonic()
+        with self._lock:
+            self._sync_users(users)
+            expires = self._entries.get(digest)
+            if expires is not None and expires > now:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return True
+            if expires is not None:
+                del self._entries[digest]
+            self.misses += 1
+        return None
+
+    def add(self, username, password, users):
+        digest = self._digest(username, password)
+        with self._lock:
+            self._sync_users(users)
+            self._entries[digest] = monotonic() + self.ttl
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def configure(self, maxsize, ttl):
+        """Apply new limits in place; cached entries keep the expiry they were given"""
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+credential_cache = CredentialCache(Config.AUTH_CACHE_SIZE, Config.AUTH_CACHE_TTL)
+
+def _verify_password(username, password):
+    PASSWORD_HASHES.inc()
+    if not check_password_hash(Config.USERS[username], password):
         return False
-    return check_password_hash(Config.USERS[username], password)
+    credential_cache.add(username, password, Config.USERS)
+    return True
+
+stage_timers.register(sys.modules[__name__], 'check_password_hash', 'auth.check_password_hash')
+
+# Failed logins are limited per client address and per username, so guesses
+# spread over many addresses still hit the per-user limit. Only attempts that would run the password hash are limited, so a flood of
+# bad guesses costs no scrypt time and cannot lock out a user whose
+# credentials are cached or who holds a session.
+ip_limiter = SlidingWindowLimiter(Config.LOGIN_ATTEMPTS_MAX, Config.LOGIN_ATTEMPTS_WINDOW)
+user_limiter = SlidingWindowLimiter(Config.LOGIN_ATTEMPTS_MAX, Config.LOGIN_ATTEMPTS_WINDOW)
+
+registry.callback('security_auth_cache_hits_total', 'Logins answered from the credential cache',
+                  lambda: credential_cache.hits, 'counter')
+registry.callback('security_auth_cache_misses_total', 'Logins not found in the credential cache',
+                  lambda: credential_cache.misses, 'counter')
+registry.callback('security_auth_throttled_total', 'Login attempts rejected by the rate limiter',
+                  lambda: {(('scope', 'ip'),): ip_limiter.blocked_total,
+                           (('scope', 'user'),): user_limiter.blocked_total}, 'counter')
+
+def login_retry_after(username):
+    """Seconds the current client must wait before trying username again, 0 if allowed"""
+    client = request.remote_addr
+    return ip_limiter.retry_after(client) or user_limiter.retry_after(username)
+
+def record_login_failure(username):
+    client = request.remote_addr
+    ip_limiter.hit(client)
+    user_limiter.hit(username)
+
+def attempt_login(username, password):
+    """Check credentials for the current client; returns (valid, retry_after).
+    A recently verified pair passes without touching the limiters"""
+    if username in Config.USERS and credential_cache.check(username, password, Config.USERS):
+        return True, 0
+    retry_after = login_retry_after(username)
+    if retry_after:
+        return False, retry_after
+    if username in Config.USERS and _verify_password(username, password):
+        return True, 0
+    record_login_failure(username)
+    return False, 0
+
+def on_config_change(changes):
+    """Hot-reload the login limits and credential cache settings"""
+    if 'LOGIN_ATTEMPTS_MAX' in changes or 'LOGIN_ATTEMPTS_WINDOW' in changes:
+        for limiter in (ip_limiter, user_limiter):
+            limiter.configure(Config.LOGIN_ATTEMPTS_MAX, Config.LOGIN_ATTEMPTS_WINDOW)
+    if 'AUTH_CACHE_SIZE' in changes or 'AUTH_CACHE_TTL' in changes:
+        credential_cache.configure(Config.AUTH_CACHE_SIZE, Config.AUTH_CACHE_TTL)
+
+def register_config_handlers(config_manager):
+    config_manager.register_handler(('LOGIN_ATTEMPTS_MAX', 'LOGIN_ATTEMPTS_WINDOW',
+                                     'AUTH_CACHE_SIZE', 'AUTH_CACHE_TTL'), on_config_change)
+
+def throttled(retry_after):
+    """Send 429 response telling the client when to retry"""
+    return Response(
+        'Too many failed login attempts.\n'
+        'Try again later', 429,
+        {'Retry-After': str(retry_after)})
+
+SESSION_COOKIE = 'sm_session'
+
+def _session_signature(user_b64, expires, password_hash):
+    # Signing over the stored hash means a password change ends existing sessions
+    message = f"{user_b64}.{expires}.{password_hash}".encode('utf-8')
+    return hmac.new(Config.SECRET_KEY.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+def issue_session(username, timeout=None):
+    """Return a signed session token for username valid for timeout seconds"""
+    if timeout is None:
+        timeout = Config.SESSION_TIMEOUT
+    expires = int(time()) + int(timeout)
+    user_b64 = base64.urlsafe_b64encode(username.encode('utf-8')).decode('ascii')
+    signature = _session_signature(user_b64, expires, Config.USERS[username])
+    return f"{user_b64}.{expires}.{signature}"
+
+def verify_session(token):
+    """Return the username of a valid, unexpired session token, otherwise None"""
+    try:
+        user_b64, expires, signature = token.split('.')
+        username = base64.urlsafe_b64decode(user_b64.encode('ascii')).decode('utf-8')
+        expires = int(expires)
+    except (ValueError, UnicodeError):
+        return None
+    if expires < time() or username not in Config.USERS:
+        return None
+    expected = _session_signature(user_b64, expires, Config.USERS[username])
+    if not hmac.compare_digest(expected, signature):
+        return None
+    return username
+
+def set_session_cookie(response, username):
+    response.set_cookie(
+        SESSION_COOKIE, issue_session(username), max_age=Config.SESSION_TIMEOUT,
+        httponly=True, samesite='Lax', secure=request.is_secure)
+    return response
+
+def clear_session_cookie(response):
+    response.delete_cookie(SESSION_COOKIE)
+    return response
+
+def current_user():
+    """Username authenticated for the current request"""
+    return g.get('user')
 
 def authenticate():
     """Send 401 response that enables basic auth"""
@@ -19,8 +206,43 @@ def authenticate():
 def requires_auth(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        auth = request.authorization
-        if not auth or not check_auth(auth.username, auth.password):
-            return authenticate()
+        token = request.cookies.get(SESSION_COOKIE)
+        username = verify_session(token) if token else None
+        if username is None:
+            auth = request.authorization
+            if not auth:
+                return authenticate()
+            valid, retry_after = attempt_login(auth.username, auth.password)
+            if retry_after:
+                return throttled(retry_after)
+            if not valid:
+                return authenticate()
+            username = auth.username
+        g.user = username
+        return f(*args, **kwargs)
+    return decorated
+
+def requires_admin(f):
+    """requires_auth, and only the admin user gets through (403 for the others)"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if current_user() != 'admin':
+            return jsonify({'success': False, 'message': 'Only admin users can do this'}), 403
         return f(*args, **kwargs)
+    return requires_auth(decorated)
+
+def requires_auth_or_signature(f):
+    """Allow capture URLs signed by url_signing.sign_capture_url without credentials.
+    Unsigned or expired requests go through requires_auth as before"""
+    protected = requires_auth(f)
+    @wraps(f)
+    def decorated(filename, *args, **kwargs):
+        remaining = verify_capture_signature(
+            filename, request.args.get('exp'), request.args.get('sig'))
+        if not remaining:
+            return protected(filename, *args, **kwargs)
+        response = make_response(f(filename, *args, **kwargs))
+        # The URL itself is the credential, so shared caches may keep it until it expires
+        response.headers['Cache-Control'] = f'public, max-age={remaining}'
+        return response
     return decorated
\ No newline at end of file
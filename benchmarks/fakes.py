@@ -0,0 +1,135 @@
+"""Stand-ins for the Raspberry Pi modules, injected into sys.modules by the
+benchmark harness only. Each fake counts the calls the real driver would
+have turned into hardware traffic."""
+import sys
+import types
+
+FRAME_SIZE = 48 * 1024  # a typical 640x480 q85 JPEG
+
+
+def make_gpio():
+    gpio = types.ModuleType('RPi.GPIO')
+    gpio.BCM = 11
+    gpio.BOARD = 10
+    gpio.OUT = 0
+    gpio.IN = 1
+    gpio.HIGH = 1
+    gpio.LOW = 0
+    gpio.PUD_UP = 22
+    gpio.PUD_DOWN = 21
+    gpio.levels = {}
+    gpio.calls = {'setup': 0, 'output': 0, 'input': 0}
+
+    def setwarnings(flag):
+        pass
+
+    def setmode(mode):
+        pass
+
+    def setup(pin, mode, pull_up_down=None, initial=None):
+        gpio.calls['setup'] += 1
+
+    def output(pin, value):
+        gpio.calls['output'] += 1
+        gpio.levels[pin] = value
+
+    def input(pin):
+        gpio.calls['input'] += 1
+        return gpio.levels.get(pin, gpio.LOW)
+
+    def cleanup(*pins):
+        gpio.levels.clear()
+
+    for func in (setwarnings, setmode, setup, output, input, cleanup):
+        setattr(gpio, func.__name__, func)
+    return gpio
+
+
+class FakeSMBus(object):
+    """Every method call is one bus transaction; bytes counts the payload"""
+
+    devices = (0x27,)
+
+    def __init__(self, busnum=1):
+        self.busnum = busnum
+        self.transactions = 0
+        self.bytes = 0
+
+    def _xfer(self, address, count):
+        if address not in self.devices:
+            raise IOError(121, 'Remote I/O error')
+        self.transactions += 1
+        self.bytes += count
+
+    def read_byte(self, address):
+        self._xfer(address, 1)
+        return 0
+
+    def read_byte_data(self, address, register):
+        self._xfer(address, 2)
+        return 0
+
+    def read_i2c_block_data(self, address, register, length):
+        self._xfer(address, 1 + length)
+        return [0] * length
+
+    def write_byte(self, address, value):
+        self._xfer(address, 1)
+
+    def write_byte_data(self, address, register, value):
+        self._xfer(address, 2)
+
+    def write_i2c_block_data(self, address, register, values):
+        self._xfer(address, 1 + len(values))
+
+    def close(self):
+        pass
+
+
+def make_picamera2():
+    from camera import SimulatedCamera
+
+    class Picamera2(SimulatedCamera):
+        """SimulatedCamera with full-size frames"""
+
+        def frame(self):
+            return b'\xff\xd8' + bytes(FRAME_SIZE - 4) + b'\xff\xd9'
+
+    class JpegEncoder(object):
+        def __init__(self, q=85):
+            self.q = q
+
+    class FileOutput(object):
+        def __init__(self, file):
+            self.file = file
+
+        def write(self, buf):
+            return self.file.write(buf)
+
+    picamera2 = types.ModuleType('picamera2')
+    encoders = types.ModuleType('picamera2.encoders')
+    outputs = types.ModuleType('picamera2.outputs')
+    picamera2.Picamera2 = Picamera2
+    encoders.JpegEncoder = JpegEncoder
+    outputs.FileOutput = FileOutput
+    picamera2.encoders = encoders
+    picamera2.outputs = outputs
+    return {'picamera2': picamera2, 'picamera2.encoders': encoders, 'picamera2.outputs': outputs}
+
+
+def install():
+    """Put the fakes in sys.modules; call before importing any repo module"""
+    gpio = make_gpio()
+    rpi = types.ModuleType('RPi')
+    rpi.GPIO = gpio
+    smbus = types.ModuleType('smbus')
+    smbus.SMBus = FakeSMBus
+    sys.modules.update({'RPi': rpi, 'RPi.GPIO': gpio, 'smbus': smbus})
+
+    # camera.py must be importable first: the fake camera builds on SimulatedCamera
+    sys.modules.update(make_picamera2())
+
+    # Never reach a real /dev/i2c-* even when benchmarking on a Pi
+    from i2c_bus import I2CBus
+    I2CBus._open_raw = lambda self: None
+    return gpio
@@ -0,0 +1,522 @@
+#!/usr/bin/env python
+"""Benchmark suite for the security monitor, runnable without a Raspberry Pi.
+
+    python benchmarks/run.py [--quick] [--only NAME ...] [-o results.json]
+
+RPi.GPIO, smbus and picamera2 are replaced by the fakes in fakes.py before
+any repo module is imported. Everything runs inside a scratch directory, so
+logs, captures and config files never touch the working tree. Results are
+written as JSON for comparing releases.
+"""
+import argparse
+import json
+import os
+import platform
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import types
+from datetime import datetime
+from time import perf_counter, process_time, sleep
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, ROOT)
+
+import fakes
+
+GPIO = fakes.install()
+
+
+def summarize(samples):
+    """Latency summary in seconds"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {'n': 0}
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+    return {
+        'n': len(ordered),
+        'mean': sum(ordered) / len(ordered),
+        'p50': pct(0.50),
+        'p95': pct(0.95),
+        'p99': pct(0.99),
+        'max': ordered[-1],
+    }
+
+
+def basic_auth_header(username, password):
+    import base64
+    token = base64.b64encode(f"{username}:{password}".encode('utf-8')).decode('ascii')
+    return {'Authorization': f"Basic {token}"}
+
+
+def use_bench_user():
+    from config import Config
+    from werkzeug.security import generate_password_hash
+    Config.USERS = {'bench': generate_password_hash('bench-password')}
+    return basic_auth_header('bench', 'bench-password')
+
+
+def bench_sse_fanout(quick):
+    """Events/s delivered through /events with 1, 10 and 100 connected clients.
+    Every client is sent every event; the burst fits each client's backlog,
+    so any drop means the broadcaster lost events"""
+    from security_monitor.app import create_app
+    app = create_app('bench_config.yaml')
+    headers = use_bench_user()
+    events = 200 if quick else 2000
+    app.status_broadcaster.backlog = events + 1
+    results = {}
+
+    for clients in (1, 10, 100):
+        lock = threading.Lock()
+        counts = [0] * clients
+        delivered = [0]
+        finished = [0]
+        last = f'"seq": {events - 1}'.encode('ascii')
+        done = threading.Event()
+        stop = threading.Event()
+
+        def consume(i):
+            # The test client pulls the first chunk before returning, so the
+            # request itself is the point where this client starts waiting
+            response = app.test_client().get('/events', headers=headers, buffered=False)
+            for chunk in response.response:
+                if stop.is_set():
+                    break
+                with lock:
+                    counts[i] += 1
+                    delivered[0] += 1
+                    if last in chunk:
+                        finished[0] += 1
+                        if finished[0] == clients:
+                            done.set()
+            response.close()
+
+        threads = [threading.Thread(target=consume, args=(i,), daemon=True) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        sleep(0.2 + clients * 0.005)  # let every client subscribe
+
+        dropped0 = app.status_broadcaster.dropped
+        t0 = perf_counter()
+        cpu0 = process_time()
+        for n in range(events):
+            app.status_queue.put({'zone': 'bench', 'door': 'OPEN', 'motion': 'NONE', 'seq': n})
+        done.wait(60)
+        elapsed = perf_counter() - t0
+        cpu = process_time() - cpu0
+        dropped = app.status_broadcaster.dropped - dropped0
+
+        # One more event wakes every blocked consumer so it sees the stop flag
+        stop.set()
+        app.status_queue.put({'zone': 'bench', 'stop': True})
+        for thread in threads:
+            thread.join(5)
+
+        results[str(clients)] = {
+            'events': delivered[0],
+            'seconds': elapsed,
+            'events_per_second': delivered[0] / elapsed if elapsed else 0.0,
+            'cpu_seconds': cpu,
+            'events_per_client_min': min(counts),
+            'events_per_client_max': max(counts),
+            'events_dropped': dropped,
+        }
+    return results
+
+
+def bench_mjpeg(quick):
+    """Bytes/s and CPU per viewer for the MJPEG generator fed by the fake camera"""
+    from security_monitor.app.routes.main_routes import generate_frames
+    from camera import CameraManager
+    from heartbeats import Watchdog
+    duration = 1.0 if quick else 5.0
+    camera = CameraManager()
+    camera.start((640, 480), 85, 30)
+    monitor = types.SimpleNamespace(output=camera.output, watchdog=Watchdog())
+    results = {}
+    idle_cpu_rate = 0.0
+
+    try:
+        for viewers in (0, 1, 5, 20):
+            stop = threading.Event()
+            sent = [0] * viewers
+            frames = [0] * viewers
+
+            def view(i):
+                stream = generate_frames(monitor)
+                for chunk in stream:
+                    sent[i] += len(chunk)
+                    frames[i] += 1
+                    if stop.is_set():
+                        break
+                stream.close()
+
+            threads = [threading.Thread(target=view, args=(i,), daemon=True) for i in range(viewers)]
+            for thread in threads:
+                thread.start()
+            cpu0 = process_time()
+            t0 = perf_counter()
+            sleep(duration)
+            cpu = process_time() - cpu0
+            elapsed = perf_counter() - t0
+            stop.set()
+            for thread in threads:
+                thread.join(5)
+
+            if viewers == 0:
+                idle_cpu_rate = cpu / elapsed  # camera and encoder alone
+                continue
+            results[str(viewers)] = {
+                'bytes_per_second': sum(sent) / elapsed,
+                'bytes_per_second_per_viewer': sum(sent) / elapsed / viewers,
+                'frames_per_second_per_viewer': sum(frames) / elapsed / viewers,
+                'cpu_per_viewer': max(0.0, cpu / elapsed - idle_cpu_rate) / viewers,
+            }
+    finally:
+        camera.close()
+    results['frame_bytes'] = fakes.FRAME_SIZE
+    return results
+
+
+def bench_lcd(quick):
+    """Bus traffic and time per Adafruit_CharLCD.message() string"""
+    from Adafruit_LCD1602 import Adafruit_CharLCD
+    from PCF8574 import PCF8574_GPIO
+    from i2c_bus import I2CBus
+    repeat = 20 if quick else 200
+    texts = {
+        'short': 'Door: OPEN',
+        'full_line': 'Motion: DETECTED',
+        'two_lines': 'Door: CLOSED\nMotion: NONE',
+    }
+
+    bus = I2CBus.get()
+    mcp = PCF8574_GPIO(0x27)
+    lcd = Adafruit_CharLCD(pin_rs=0, pin_e=2, pins_db=[4, 5, 6, 7], GPIO=mcp)
+    lcd.begin(16, 2)
+    direct = Adafruit_CharLCD(GPIO=GPIO)
+    direct.begin(16, 2)
+    results = {}
+
+    for name, text in texts.items():
+        transactions, smbus_calls, smbus_bytes = bus.transactions, bus.bus.transactions, bus.bus.bytes
+        t0 = perf_counter()
+        for _ in range(repeat):
+            lcd.message(text)
+        elapsed = perf_counter() - t0
+        gpio_writes = GPIO.calls['output']
+        for _ in range(repeat):
+            direct.message(text)
+        results[name] = {
+            'chars': len(text),
+            'seconds_per_message': elapsed / repeat,
+            'i2c_transactions_per_message': (bus.transactions - transactions) / repeat,
+            'smbus_calls_per_message': (bus.bus.transactions - smbus_calls) / repeat,
+            'bus_bytes_per_message': (bus.bus.bytes - smbus_bytes) / repeat,
+            'gpio_writes_per_message': (GPIO.calls['output'] - gpio_writes) / repeat,
+        }
+
+    # render() against the shadow buffer: a full redraw, then an unchanged screen
+    lines = ('Door: CLOSED', 'Motion: NONE')
+    lcd.clear()
+    lcd.begin(16, 2)
+    for label in ('render_first', 'render_unchanged'):
+        transactions = bus.transactions
+        t0 = perf_counter()
+        cells = lcd.render(lines)
+        results[label] = {
+            'seconds': perf_counter() - t0,
+            'cells_written': cells,
+            'i2c_transactions': bus.transactions - transactions,
+        }
+    return results
+
+
+def bench_check_auth(quick):
+    """attempt_login latency with a cold cache (scrypt), a warm cache and a wrong password.
+    The limiters are reset between attempts, so every wrong guess pays for its hash"""
+    import auth
+    from flask import Flask
+    use_bench_user()
+    slow = 3 if quick else 10
+    fast = 1000 if quick else 20000
+    client = '127.0.0.1'
+
+    def unthrottle(username):
+        auth.ip_limiter.reset(client)
+        auth.user_limiter.reset(username)
+
+    with Flask(__name__).test_request_context(environ_base={'REMOTE_ADDR': client}):
+        cold = []
+        for _ in range(slow):
+            auth.credential_cache.clear()
+            t0 = perf_counter()
+            assert auth.attempt_login('bench', 'bench-password')[0]
+            cold.append(perf_counter() - t0)
+
+        warm = []
+        for _ in range(fast):
+            t0 = perf_counter()
+            auth.attempt_login('bench', 'bench-password')
+            warm.append(perf_counter() - t0)
+
+        wrong = []
+        for _ in range(slow):
+            unthrottle('bench')
+            t0 = perf_counter()
+            auth.attempt_login('bench', 'not-the-password')
+            wrong.append(perf_counter() - t0)
+
+        unknown = []
+        for _ in range(fast):
+            unthrottle('nobody')
+            t0 = perf_counter()
+            auth.attempt_login('nobody', 'bench-password')
+            unknown.append(perf_counter() - t0)
+        unthrottle('bench')
+        unthrottle('nobody')
+
+    return {
+        'cold_cache': summarize(cold),
+        'warm_cache': summarize(warm),
+        'wrong_password': summarize(wrong),
+        'unknown_user': summarize(unknown),
+        'cache': auth.credential_cache.stats(),
+    }
+
+
+def bench_capture(quick):
+    """SecurityMonitor.capture_image latency to disk with the fake camera"""
+    from security_monitor.app.core.security_monitor import SecurityMonitor
+    captures = 10 if quick else 100
+    monitor = SecurityMonitor(queue.Queue())
+    samples = []
+    try:
+        if not monitor.readiness.wait('camera', 30):
+            raise RuntimeError("camera did not become ready")
+        for _ in range(captures):
+            t0 = perf_counter()
+            filename = monitor.capture_image('bench')
+            samples.append(perf_counter() - t0)
+            if filename is None:
+                raise RuntimeError("capture_image failed, see the log in the scratch directory")
+    finally:
+        monitor.cleanup()
+    result = summarize(samples)
+    result['bytes_per_capture'] = fakes.FRAME_SIZE
+    return result
+
+
+def bench_config(quick):
+    """ConfigurationManager save (update_config with backup) and load times"""
+    from config_manager import ConfigurationManager
+    iterations = 20 if quick else 200
+    manager = ConfigurationManager('bench_config.yaml')
+
+    saves = []
+    for i in range(iterations):
+        t0 = perf_counter()
+        success, message = manager.update_config({'BUZZER_INTERVAL': 3 + i % 2})
+        saves.append(perf_counter() - t0)
+        if not success:
+            raise RuntimeError(message)
+
+    loads = []
+    for _ in range(iterations):
+        t0 = perf_counter()
+        manager._load_config()
+        loads.append(perf_counter() - t0)
+
+    return {
+        'save': summarize(saves),
+        'load': summarize(loads),
+        'backups': len(manager.list_backups()),
+    }
+
+
+def bench_frame_ring(quick):
+    """Publishing a frame into shared memory and copying it back out"""
+    from shared_frames import FrameRing
+    frame = b'\xff\xd8' + bytes(fakes.FRAME_SIZE - 4) + b'\xff\xd9'
+    iterations = 200 if quick else 2000
+    ring = FrameRing()
+    try:
+        writes, reads = [], []
+        for _ in range(iterations):
+            t0 = perf_counter()
+            ring.write(frame)
+            t1 = perf_counter()
+            number, copy = ring.read()
+            reads.append(perf_counter() - t1)
+            writes.append(t1 - t0)
+        if copy != frame:
+            raise RuntimeError('frame ring returned a different frame')
+        return {
+            'frame_bytes': len(frame),
+            'write': summarize(writes),
+            'read': summarize(reads),
+        }
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def bench_http(quick):
+    """Requests/s for /healthz over keep-alive from 1, 8 and 32 clients, on the
+    pool server and on the Werkzeug development server"""
+    import http.client
+    from werkzeug.serving import make_server
+    from security_monitor.app import create_app
+    from web_server import PoolServer
+    app = create_app('bench_config.yaml')
+    requests = 50 if quick else 500
+    results = {}
+
+    for kind in ('pool', 'werkzeug'):
+        if kind == 'pool':
+            server = PoolServer('127.0.0.1', 0, app)
+        else:
+            server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        results[kind] = {}
+        for clients in (1, 8, 32):
+            statuses = []
+            lock = threading.Lock()
+
+            def client():
+                conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=10)
+                seen = []
+                for _ in range(requests):
+                    try:
+                        conn.request('GET', '/healthz')
+                        response = conn.getresponse()
+                        response.read()
+                        seen.append(response.status)
+                    except (OSError, http.client.HTTPException):
+                        seen.append(None)
+                        conn.close()
+                conn.close()
+                with lock:
+                    statuses.extend(seen)
+
+            threads = [threading.Thread(target=client) for _ in range(clients)]
+            t0 = perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = perf_counter() - t0
+            results[kind][str(clients)] = {
+                'requests': len(statuses),
+                'requests_per_second': len(statuses) / elapsed,
+                'ok': statuses.count(200),
+                'busy': statuses.count(503),
+                'failed': statuses.count(None),
+            }
+        if kind == 'pool':
+            results[kind]['server'] = server.stats()
+        server.shutdown()
+    return results
+
+
+def bench_import(quick):
+    """Cold start of the web app in a fresh interpreter, without any fake hardware"""
+    code = ("import json, sys, time\n"
+            "t0 = time.perf_counter()\n"
+            "from security_monitor.app import create_app\n"
+            "create_app('bench_import.yaml')\n"
+            "print(json.dumps([time.perf_counter() - t0,"
+            " [m for m in ('RPi', 'smbus', 'picamera2') if m in sys.modules]]))\n")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    runs = 3 if quick else 10
+    create_times, process_times, hardware = [], [], set()
+    for _ in range(runs):
+        t0 = perf_counter()
+        output = subprocess.check_output([sys.executable, '-c', code], env=env)
+        process_times.append(perf_counter() - t0)
+        elapsed, loaded = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        create_times.append(elapsed)
+        hardware.update(loaded)
+    return {
+        'create_app': summarize(create_times),
+        'process': summarize(process_times),
+        'hardware_modules_loaded': sorted(hardware),
+    }
+
+
+BENCHMARKS = {
+    'sse_fanout': bench_sse_fanout,
+    'mjpeg': bench_mjpeg,
+    'lcd_message': bench_lcd,
+    'check_auth': bench_check_auth,
+    'capture': bench_capture,
+    'config': bench_config,
+    'frame_ring': bench_frame_ring,
+    'http': bench_http,
+    'import': bench_import,
+}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-o', '--output', help='write JSON results here instead of stdout')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='run only these benchmarks')
+    parser.add_argument('--quick', action='store_true', help='fewer iterations, for a smoke run')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directory')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    scratch = tempfile.mkdtemp(prefix='security-monitor-bench-')
+    os.chdir(scratch)
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'quick': args.quick,
+        },
+        'results': {},
+    }
+    try:
+        for name in args.only or BENCHMARKS:
+            print(f"running {name}...", file=sys.stderr)
+            t0 = perf_counter()
+            try:
+                report['results'][name] = BENCHMARKS[name](args.quick)
+            except Exception as e:
+                report['results'][name] = {'error': f"{type(e).__name__}: {e}"}
+            print(f"  {name} finished in {perf_counter() - t0:.1f}s", file=sys.stderr)
+    finally:
+        os.chdir(ROOT)
+        if args.keep:
+            print(f"scratch directory: {scratch}", file=sys.stderr)
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import queue
+import threading
+
+
+class StatusBroadcaster(object):
+    """Fans events from one source queue out to every subscriber.
+
+    A single dispatcher thread drains the source queue and copies each event
+    into one bounded queue per subscriber, so every /events client sees every
+    event. A client that falls behind loses its oldest events rather than
+    holding up the others. The dispatcher starts with the first subscriber:
+    a process that never serves /events (the hardware daemon) leaves the
+    source queue to its own reader.
+    """
+
+    def __init__(self, source, backlog=100):
+        self.source = source
+        self.backlog = backlog
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.dropped = 0
+
+    def subscribe(self):
+        subscriber = queue.Queue(self.backlog)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='StatusBroadcast', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _run(self):
+        while True:
+            event = self.source.get()
+            with self._lock:
+                subscribers = tuple(self._subscribers)
+            for subscriber in subscribers:
+                self._offer(subscriber, event)
+
+    def _offer(self, subscriber, event):
+        while True:
+            try:
+                subscriber.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    subscriber.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def __len__(self):
+        return len(self._subscribers)
@@ -0,0 +1,190 @@
+import io
+import logging
+import threading
+from time import perf_counter
+from metrics import FRAMES_ENCODED
+
+
+class StreamingOutput(io.BufferedIOBase):
+    def __init__(self):
+        self.frame = None
+        self.condition = threading.Condition()
+        self.sinks = []  # extra consumers of every frame, e.g. a shared memory FrameRing
+
+    def write(self, buf):
+        with self.condition:
+            self.frame = buf
+            self.condition.notify_all()
+        for sink in self.sinks:
+            sink(buf)
+        FRAMES_ENCODED.inc()
+        return len(buf)
+
+
+def _picamera2_factories():
+    from picamera2 import Picamera2
+    from picamera2.encoders import JpegEncoder
+    from picamera2.outputs import FileOutput
+    return Picamera2, (lambda quality: JpegEncoder(q=quality)), FileOutput
+
+
+class CameraManager(object):
+    """Owns the single camera instance and its streaming output.
+
+    Resolution, JPEG quality and frame rate changes are applied with
+    stop/configure/start on the same camera object, and the StreamingOutput
+    is never replaced, so MJPEG viewers waiting on it stay attached across a
+    switch.
+    """
+
+    def __init__(self, camera_factory=None, encoder_factory=None, output_factory=None, logger=None):
+        if camera_factory is None:
+            camera_factory, default_encoder, default_output = _picamera2_factories()
+            encoder_factory = encoder_factory or default_encoder
+            output_factory = output_factory or default_output
+        self.camera_factory = camera_factory
+        self.encoder_factory = encoder_factory
+        self.output_factory = output_factory
+        self.logger = logger or logging.getLogger('SecurityMonitor')
+        self.lock = threading.RLock()
+        self.output = StreamingOutput()
+        self.camera = None
+        self.encoder = None
+        self.recording = False
+        self.resolution = None
+        self.quality = None
+        self.framerate = None
+        self.switches = 0
+        self.last_switch_latency = 0.0
+        self.max_switch_latency = 0.0
+
+    @classmethod
+    def simulated(cls, logger=None):
+        """Camera manager backed by SimulatedCamera, for tests and benchmarks"""
+        return cls(SimulatedCamera, SimulatedEncoder, lambda output: output, logger)
+
+    def _configure(self):
+        config = self.camera.create_video_configuration(
+            main={"size": tuple(self.resolution)},
+            controls={"FrameRate": self.framerate})
+        self.camera.configure(config)
+        self.encoder = self.encoder_factory(self.quality)
+        self.camera.start_recording(self.encoder, self.output_factory(self.output))
+        self.recording = True
+
+    def start(self, resolution, quality, framerate):
+        with self.lock:
+            self.resolution = tuple(resolution)
+            self.quality = quality
+            self.framerate = framerate
+            if self.camera is None:
+                self.camera = self.camera_factory()
+            if not self.recording:
+                self._configure()
+
+    def reconfigure(self, resolution=None, quality=None, framerate=None):
+        """Apply new settings in place; returns the switch latency in seconds"""
+        with self.lock:
+            new_resolution = self.resolution if resolution is None else tuple(resolution)
+            new_quality = self.quality if quality is None else quality
+            new_framerate = self.framerate if framerate is None else framerate
+            if (new_resolution, new_quality, new_framerate) == (self.resolution, self.quality, self.framerate):
+                return 0.0
+
+            started = perf_counter()
+            if self.recording:
+                self.camera.stop_recording()
+                self.recording = False
+            self.resolution = new_resolution
+            self.quality = new_quality
+            self.framerate = new_framerate
+            self._configure()
+            latency = perf_counter() - started
+
+            self.switches += 1
+            self.last_switch_latency = latency
+            self.max_switch_latency = max(self.max_switch_latency, latency)
+            self.logger.info(f"Camera reconfigured to {self.resolution} q={self.quality} "
+                             f"{self.framerate}fps in {latency * 1000:.0f} ms")
+            return latency
+
+    def capture_file(self, filepath):
+        with self.lock:
+            self.camera.capture_file(filepath)
+
+    def close(self):
+        with self.lock:
+            if self.camera is None:
+                return
+            if self.recording:
+                self.camera.stop_recording()
+                self.recording = False
+            self.camera.close()
+            self.camera = None
+
+    def stats(self):
+        return {
+            'resolution': self.resolution,
+            'quality': self.quality,
+            'framerate': self.framerate,
+            'switches': self.switches,
+            'last_switch_latency': self.last_switch_latency,
+            'max_switch_latency': self.max_switch_latency,
+        }
+
+
+class SimulatedEncoder(object):
+    def __init__(self, quality):
+        self.quality = quality
+
+
+class SimulatedCamera(object):
+    """Stand-in for Picamera2 that emits fake JPEG frames at the configured rate"""
+
+    def __init__(self):
+        self.config = None
+        self.thread = None
+        self.running = False
+        self.frames = 0
+        self.stop_event = threading.Event()
+
+    def create_video_configuration(self, main=None, controls=None):
+        return {'main': dict(main or {}), 'controls': dict(controls or {})}
+
+    def configure(self, config):
+        if self.running:
+            raise RuntimeError("Camera must be stopped before configure()")
+        self.config = config
+
+    def frame(self):
+        width, height = self.config['main'].get('size', (640, 480))
+        header = f"{width}x{height}#{self.frames}".encode('ascii')
+        return b'\xff\xd8' + header + b'\xff\xd9'
+
+    def start_recording(self, encoder, output):
+        if self.config is None:
+            raise RuntimeError("Camera is not configured")
+        self.running = True
+        self.stop_event.clear()
+        interval = 1.0 / (self.config['controls'].get('FrameRate') or 30)
+
+        def run():
+            while not self.stop_event.wait(interval):
+                self.frames += 1
+                output.write(self.frame())
+
+        self.thread = threading.Thread(target=run, name='SimulatedCamera', daemon=True)
+        self.thread.start()
+
+    def stop_recording(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        self.running = False
+
+    def capture_file(self, filepath):
+        with open(filepath, 'wb') as f:
+            f.write(self.frame())
+
+    def close(self):
+        self.stop_recording()
@@ -1,4 +1,6 @@
 import os
+import threading
+from types import MappingProxyType
 
 class Config:
     # GPIO Pin Configuration
@@ -7,6 +9,13 @@ class Config:
     BUZZER_PIN = 12
     MOTION_SENSOR_PIN = 18
     MOTION_LED_PIN = 21
+
+    # Sensor registry: one entry per zone, e.g.
+    #   {'zone': 'door', 'type': 'door', 'pin': 16, 'led_pin': 17}
+    # Optional keys: debounce (seconds), led_pin, buzzer (beep while active),
+    # pull_up, active_high. Empty means one door and one motion zone on the
+    # *_PIN settings above, following them when they change.
+    SENSORS = []
     
     # Timing Configuration
     BUZZER_INTERVAL = 3
@@ -19,7 +28,142 @@ class Config:
         'admin': 'scrypt:32768:8:1$zlBphNHgonre4CaR$ed45c748c060576054decf09b9a35fc80587f3f3040243506e850ee0d8cb4d18a0ac002d10ce2f763782e25bd99fe7db3275d5601ed8decfef3f34af811b10a8'  # Use generate_password_hash()
     }
     
+    LOGIN_ATTEMPTS_MAX = 5
+    LOGIN_ATTEMPTS_WINDOW = 300
+    SESSION_TIMEOUT = 3600
+    CAPTURE_URL_TTL = 600   # lifetime of signed capture links pushed to the dashboard
+    
+    # Successful password checks are cached so scrypt runs once per TTL, not per request
+    AUTH_CACHE_SIZE = 256
+    AUTH_CACHE_TTL = 300
+
+    # Camera Configuration
+    IMAGE_RESOLUTION = (640, 480)
+    IMAGE_QUALITY = 85
+    CAMERA_FRAMERATE = 30
+    MOTION_DETECTION_SENSITIVITY = 50
+    
     # Paths Configuration
     IMAGE_DIR = 'static/captures'
     LOG_FILE = 'security_monitor.log'
     LOG_LEVEL = 'INFO'
+    LOG_FORMAT = 'text'     # 'text' or 'json' (one JSON object per line)
+    LOG_QUEUE_SIZE = 10000  # records beyond this are dropped rather than blocking callers
+    LOG_RATE_LIMIT = 10     # max INFO/DEBUG records per call site per LOG_RATE_WINDOW
+    LOG_RATE_WINDOW = 10
+    LOG_MAX_BYTES = 1024 * 1024             # active log size before it is rotated and compressed
+    LOG_ARCHIVE_MAX_BYTES = 5 * 1024 * 1024  # compressed history kept; oldest segments go first
+    CONFIG_FILE = 'security_config.yaml'
+    BACKUP_DIR = 'config_backups'
+    BACKUP_RETENTION_COUNT = 50
+    BACKUP_RETENTION_DAYS = 90
+
+    # Startup Configuration
+    HARDWARE_READY_TIMEOUT = 30.0  # how long the loop and video streams wait for hardware at boot
+
+    # Web Server Configuration (read at startup)
+    WEB_SERVER = 'pool'            # 'pool' (bounded thread pools) or 'werkzeug' (development server)
+    WEB_THREADS = 8                # threads for ordinary requests
+    WEB_STREAM_THREADS = 8         # concurrent /video_feed and /events streams
+    WEB_MAX_CONNECTIONS = 64       # open connections beyond this get an immediate 503
+    WEB_KEEPALIVE_TIMEOUT = 5.0    # idle keep-alive connections are closed after this many seconds
+    WEB_REQUEST_TIMEOUT = 15.0     # socket timeout while reading a request body or writing a response
+    WEB_HEADER_TIMEOUT = 5.0       # deadline for a whole request line and headers to arrive
+
+    # Process Configuration (read at startup)
+    WEB_WORKERS = 0                    # 0 serves the web app from the hardware process; N forks N web workers
+    FRAME_RING_SLOTS = 4               # shared memory frames kept for the web workers
+    FRAME_SLOT_BYTES = 512 * 1024      # largest JPEG frame the ring can carry
+
+    # Watchdog Configuration
+    WATCHDOG_TIMEOUT = 5.0      # seconds without a heartbeat before a component counts as stalled
+    WATCHDOG_SD_NOTIFY = True   # ping systemd's watchdog when NOTIFY_SOCKET is set
+
+    # Notification Configuration
+    ENABLE_EMAIL_NOTIFICATIONS = False
+    NOTIFICATION_EMAIL = ''
+    SMTP_SERVER = ''
+    SMTP_PORT = 587
+    SMTP_USERNAME = ''
+    SMTP_PASSWORD = ''
+
+
+CONFIG_FIELDS = tuple(key for key in vars(Config) if key.isupper())
+
+# Resolved against the working directory when stored, so files are written
+# and served from the same place whatever Flask's root_path is
+ABSOLUTE_PATHS = ('IMAGE_DIR',)
+
+def _resolve_paths(values):
+    return {key: os.path.abspath(value) if key in ABSOLUTE_PATHS and value else value
+            for key, value in values.items()}
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+class ConfigSnapshot:
+    """Immutable view of every setting at one version.
+
+    Hot loops keep a reference and compare its version with
+    config_store.version to notice updates, instead of reading the mutable
+    Config class attribute by attribute.
+    """
+    __slots__ = ('version',) + CONFIG_FIELDS
+
+    def __init__(self, version, values):
+        object.__setattr__(self, 'version', version)
+        for key in CONFIG_FIELDS:
+            object.__setattr__(self, key, _freeze(values[key]))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ConfigSnapshot is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('ConfigSnapshot is immutable')
+
+    def replace(self, changes):
+        values = self.as_dict()
+        values.update(changes)
+        return ConfigSnapshot(self.version + 1, values)
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in CONFIG_FIELDS}
+
+class ConfigStore:
+    """Holds the current ConfigSnapshot; updates build a new one and swap it in.
+
+    Readers never lock: fetching the snapshot is a single attribute read. The
+    Config class is kept in sync for code that still reads it directly.
+    """
+
+    def __init__(self, source=Config):
+        self._lock = threading.Lock()
+        values = _resolve_paths({key: getattr(source, key) for key in CONFIG_FIELDS})
+        for key in ABSOLUTE_PATHS:
+            setattr(Config, key, values[key])
+        self._snapshot = ConfigSnapshot(0, values)
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def current(self):
+        return self._snapshot
+
+    def update(self, changes):
+        unknown = set(changes) - set(CONFIG_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown configuration keys: {', '.join(sorted(unknown))}")
+        changes = _resolve_paths(changes)
+        with self._lock:
+            snapshot = self._snapshot.replace(changes)
+            for key, value in changes.items():
+                setattr(Config, key, value)
+            self._snapshot = snapshot
+        return snapshot
+
+config_store = ConfigStore()
@@ -1,11 +1,18 @@
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field, replace
+import fcntl
 import json
 import os
-from typing import Dict, Any, Optional
+import re
+import hashlib
+from typing import Dict, Any, Optional, Callable, Iterable, Tuple, Union
 import yaml
-from functools import wraps
+from contextlib import contextmanager
+from functools import lru_cache
 import logging
+import threading
 from datetime import datetime
+from sensors import SensorRegistry, default_sensor_defs
+from config import config_store
 
 @dataclass
 class SystemConfig:
@@ -15,27 +22,59 @@ class SystemConfig:
     BUZZER_PIN: int = 12
     MOTION_SENSOR_PIN: int = 18
     MOTION_LED_PIN: int = 21
+
+    # Sensor registry (see config.Config.SENSORS); empty follows the *_PIN settings
+    SENSORS: list = field(default_factory=list)
     
     # Timing Configuration
     BUZZER_INTERVAL: int = 3
     CAPTURE_INTERVAL: int = 5
     DISPLAY_UPDATE_INTERVAL: float = 0.5
+    HARDWARE_READY_TIMEOUT: float = 30.0
+    WATCHDOG_TIMEOUT: float = 5.0
+    WATCHDOG_SD_NOTIFY: bool = True
+    
+    # Web Server Configuration
+    WEB_SERVER: str = 'pool'
+    WEB_THREADS: int = 8
+    WEB_STREAM_THREADS: int = 8
+    WEB_MAX_CONNECTIONS: int = 64
+    WEB_KEEPALIVE_TIMEOUT: float = 5.0
+    WEB_REQUEST_TIMEOUT: float = 15.0
+    WEB_HEADER_TIMEOUT: float = 5.0
+    
+    # Process Configuration
+    WEB_WORKERS: int = 0
+    FRAME_RING_SLOTS: int = 4
+    FRAME_SLOT_BYTES: int = 512 * 1024
     
     # Security Configuration
     LOGIN_ATTEMPTS_MAX: int = 5
     LOGIN_ATTEMPTS_WINDOW: int = 300
     SESSION_TIMEOUT: int = 3600
+    CAPTURE_URL_TTL: int = 600
+    AUTH_CACHE_SIZE: int = 256
+    AUTH_CACHE_TTL: int = 300
     
     # Storage Configuration
     IMAGE_DIR: str = 'static/captures'
     LOG_FILE: str = 'security_monitor.log'
     LOG_LEVEL: str = 'INFO'
+    LOG_FORMAT: str = 'text'
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_RATE_LIMIT: int = 10
+    LOG_RATE_WINDOW: int = 10
+    LOG_MAX_BYTES: int = 1024 * 1024
+    LOG_ARCHIVE_MAX_BYTES: int = 5 * 1024 * 1024
     CONFIG_FILE: str = 'security_config.yaml'
     BACKUP_DIR: str = 'config_backups'
+    BACKUP_RETENTION_COUNT: int = 50
+    BACKUP_RETENTION_DAYS: int = 90
     
     # Image and Video Configuration
     IMAGE_RESOLUTION: tuple = (640, 480)
     IMAGE_QUALITY: int = 85
+    CAMERA_FRAMERATE: int = 30
     MOTION_DETECTION_SENSITIVITY: int = 50
     
     # Notification Configuration
@@ -46,12 +85,55 @@ class SystemConfig:
     SMTP_USERNAME: str = ''
     SMTP_PASSWORD: str = ''
 
+ConfigChanges = Dict[str, Tuple[Any, Any]]
+
+BACKUP_INDEX_FILE = 'index.json'
+BACKUP_LOCK_FILE = 'index.lock'
+# Backups written before the index existed, e.g. config_backup_20240131_120000.yaml
+LEGACY_BACKUP = re.compile(r'config_backup_(\d{8}_\d{6})\.yaml$')
+
+@lru_cache(maxsize=32)
+def _read_backup(path: str, signature: tuple) -> Dict[str, Any]:
+    # Backups are content-addressed, so a cached parse stays valid; the stat
+    # signature still guards legacy timestamp-named backups
+    with open(path, 'r') as f:
+        return yaml.safe_load(f) or {}
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp_path = f'{path}.{os.getpid()}.tmp'  # web workers may save at the same time
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+BOOL_STRINGS = {'true': True, '1': True, 'on': True, 'yes': True,
+                'false': False, '0': False, 'off': False, 'no': False}
+
+def _to_bool(value: Any) -> bool:
+    # bool('false') is True: form and API values arrive as strings
+    if isinstance(value, str):
+        try:
+            return BOOL_STRINGS[value.strip().lower()]
+        except KeyError:
+            raise ValueError(f"not a boolean: {value!r}")
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    raise TypeError(f"not a boolean: {value!r}")
+
 class ConfigurationManager:
     def __init__(self, config_file: str = 'security_config.yaml'):
         self.config_file = config_file
         self.config = SystemConfig()
         self.logger = logging.getLogger('SecurityMonitor')
+        self._lock = threading.RLock()
+        self._handlers = []
+        self._file_signature = None
+        self._watch_stop = threading.Event()
+        self._watch_thread = None
+        self._backup_index = None
+        self._backup_index_signature = None
+        self._backup_list = None
         self._load_config()
+        self._file_signature = self._stat_config_file()
         
     def _load_config(self) -> None:
         """Load configuration from YAML file"""
@@ -60,16 +142,29 @@ class ConfigurationManager:
                 with open(self.config_file, 'r') as f:
                     config_data = yaml.safe_load(f)
                     if config_data:
+                        loaded = {}
                         for key, value in config_data.items():
                             if hasattr(self.config, key):
-                                setattr(self.config, key, value)
+                                # YAML has no tuples; keep the dataclass types
+                                if isinstance(getattr(self.config, key), tuple) and isinstance(value, list):
+                                    value = tuple(value)
+                                loaded[key] = value
+                        self.config = replace(self.config, **loaded)
+                        self._unpin_default_sensors()
                 self.logger.info("Configuration loaded successfully")
             else:
                 self._save_config()  # Create default config file
+            config_store.update(asdict(self.config))
         except Exception as e:
             self.logger.error(f"Error loading configuration: {str(e)}")
             
-    def _save_config(self) -> None:
+    def _unpin_default_sensors(self) -> None:
+        """Older files store the door/motion registry built from the pins;
+        clear it so the registry follows *_PIN updates again"""
+        if self.config.SENSORS in (default_sensor_defs(SystemConfig), default_sensor_defs(self.config)):
+            self.config = replace(self.config, SENSORS=[])
+
+    def _save_config(self, changed_keys: Iterable[str] = ()) -> None:
         """Save current configuration to YAML file"""
         try:
             # Create backup directory if it doesn't exist
@@ -77,22 +172,166 @@ class ConfigurationManager:
             
             # Create backup of current config if it exists
             if os.path.exists(self.config_file):
-                backup_time = datetime.now().strftime('%Y%m%d_%H%M%S')
-                backup_file = os.path.join(
-                    self.config.BACKUP_DIR, 
-                    f'config_backup_{backup_time}.yaml'
-                )
-                os.rename(self.config_file, backup_file)
+                self._backup_config_file(changed_keys)
             
             # Save new configuration
-            with open(self.config_file, 'w') as f:
-                yaml.dump(asdict(self.config), f, default_flow_style=False)
+            data = yaml.safe_dump(asdict(self.config), default_flow_style=False)
+            _write_atomic(self.config_file, data.encode('utf-8'))
+            self._file_signature = self._stat_config_file()
             self.logger.info("Configuration saved successfully")
         except Exception as e:
             self.logger.error(f"Error saving configuration: {str(e)}")
+
+    def _backup_index_path(self) -> str:
+        return os.path.join(self.config.BACKUP_DIR, BACKUP_INDEX_FILE)
+
+    def _stat_backup_index(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self._backup_index_path())
+            return (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            return None
+
+    @contextmanager
+    def _backup_index_lock(self):
+        """Exclusive lock across processes sharing BACKUP_DIR, held for a read-modify-write"""
+        with open(os.path.join(self.config.BACKUP_DIR, BACKUP_LOCK_FILE), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load_backup_index(self) -> list:
+        """Backup index entries, oldest first; re-read whenever the file changes on disk"""
+        signature = self._stat_backup_index()
+        if self._backup_index is None or signature != self._backup_index_signature:
+            try:
+                with open(self._backup_index_path(), 'r') as f:
+                    self._backup_index = json.load(f)
+            except FileNotFoundError:
+                self._backup_index = self._legacy_backup_entries()
+            except (OSError, ValueError) as e:
+                self.logger.error(f"Error reading backup index: {str(e)}")
+                self._backup_index = []
+            self._backup_index_signature = signature
+            self._backup_list = None
+        return self._backup_index
+
+    def _legacy_backup_entries(self) -> list:
+        """Index entries for timestamp-named backups from before the index; they
+        are written out with the next backup"""
+        entries = []
+        try:
+            names = sorted(os.listdir(self.config.BACKUP_DIR))
+        except OSError:
+            return entries
+        for name in names:
+            match = LEGACY_BACKUP.match(name)
+            if not match:
+                continue
+            try:
+                with open(os.path.join(self.config.BACKUP_DIR, name), 'rb') as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+            except OSError:
+                continue
+            entries.append({
+                'timestamp': datetime.strptime(match.group(1), '%Y%m%d_%H%M%S').isoformat(),
+                'hash': digest,
+                'file': name,
+                'changed_keys': [],
+            })
+        return entries
+
+    def _backup_config_file(self, changed_keys: Iterable[str]) -> None:
+        """Store the config file about to be replaced under its content hash"""
+        with open(self.config_file, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        backup_file = f'{digest[:16]}.yaml'
+        backup_path = os.path.join(self.config.BACKUP_DIR, backup_file)
+
+        # Other processes append to the same index: reload and write it under the lock
+        with self._backup_index_lock():
+            if not os.path.exists(backup_path):
+                _write_atomic(backup_path, content)
+            index = self._load_backup_index()
+            index.append({
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'hash': digest,
+                'file': backup_file,
+                'changed_keys': sorted(changed_keys),
+            })
+            self._prune_backups(index)
+            _write_atomic(self._backup_index_path(), json.dumps(index, indent=1).encode('utf-8'))
+            self._backup_index_signature = self._stat_backup_index()
+        self._backup_list = None
+
+    def _prune_backups(self, index: list) -> None:
+        """Apply count and age retention, deleting files no entry refers to any more"""
+        cutoff = datetime.now().timestamp() - self.config.BACKUP_RETENTION_DAYS * 86400
+        keep = [entry for entry in index[-self.config.BACKUP_RETENTION_COUNT:]
+                if datetime.fromisoformat(entry['timestamp']).timestamp() >= cutoff]
+        if len(keep) == len(index):
+            return
+        kept_files = {entry['file'] for entry in keep}
+        for entry in index:
+            if entry['file'] not in kept_files:
+                kept_files.add(entry['file'])  # delete each file only once
+                try:
+                    os.remove(os.path.join(self.config.BACKUP_DIR, entry['file']))
+                except OSError:
+                    pass
+        index[:] = keep
+
+    def list_backup_entries(self) -> list:
+        """Backup index entries (timestamp, hash, file, changed_keys), newest first"""
+        return list(reversed(self._load_backup_index()))
+
+    def diff_backups(self, old_file: str, new_file: str) -> ConfigChanges:
+        """Changes needed to go from one backup to another"""
+        return self.diff_config(self._read_backup_file(old_file), self._read_backup_file(new_file))
+
+    def _read_backup_file(self, backup_file: str) -> Dict[str, Any]:
+        if os.path.basename(backup_file) != backup_file:
+            raise ValueError(f"Invalid backup file: {backup_file}")
+        path = os.path.join(self.config.BACKUP_DIR, backup_file)
+        st = os.stat(path)
+        return _read_backup(path, (st.st_mtime_ns, st.st_size))
             
-    def update_config(self, updates: Dict[str, Any]) -> tuple[bool, str]:
+    def register_handler(self, keys: Union[Iterable[str], Callable[[str], bool]],
+                         handler: Callable[[ConfigChanges], None]) -> None:
+        """Call handler with the relevant subset of changes whenever a matching key changes.
+        keys is either a collection of key names or a predicate on the key name"""
+        if callable(keys):
+            matches = keys
+        else:
+            key_set = frozenset(keys)
+            matches = key_set.__contains__
+        self._handlers.append((matches, handler))
+
+    @staticmethod
+    def diff_config(old: Dict[str, Any], new: Dict[str, Any]) -> ConfigChanges:
+        """Map every key whose value differs to its (old, new) pair"""
+        return {key: (old.get(key), value) for key, value in new.items()
+                if old.get(key) != value}
+
+    def _dispatch(self, changes: ConfigChanges) -> None:
+        for matches, handler in self._handlers:
+            relevant = {key: change for key, change in changes.items() if matches(key)}
+            if not relevant:
+                continue
+            try:
+                handler(relevant)
+            except Exception as e:
+                self.logger.error(f"Error applying configuration change {sorted(relevant)}: {str(e)}")
+
+    def update_config(self, updates: Dict[str, Any], save: bool = True) -> tuple[bool, str]:
         """Update configuration with validation"""
+        with self._lock:
+            return self._update_config(updates, save)
+
+    def _update_config(self, updates: Dict[str, Any], save: bool) -> tuple[bool, str]:
         try:
             # Validate updates
             for key, value in updates.items():
@@ -104,7 +343,8 @@ class ConfigurationManager:
                 if not isinstance(value, expected_type):
                     try:
                         # Attempt type conversion
-                        updates[key] = expected_type(value)
+                        convert = _to_bool if expected_type is bool else expected_type
+                        updates[key] = convert(value)
                     except (ValueError, TypeError):
                         return False, f"Invalid type for {key}: expected {expected_type.__name__}"
                 
@@ -112,15 +352,67 @@ class ConfigurationManager:
                 if not self._validate_value(key, updates[key]):
                     return False, f"Invalid value for {key}"
             
-            # Apply updates
-            for key, value in updates.items():
-                setattr(self.config, key, value)
+            changes = self.diff_config(asdict(self.config), updates)
+            if not changes:
+                return True, "Configuration unchanged"
+
+            # Apply updates: swap in a new object so readers never see half an update
+            values = {key: value for key, (_, value) in changes.items()}
+            self.config = replace(self.config, **values)
+            config_store.update(values)
             
             # Save updated configuration
-            self._save_config()
+            if save:
+                self._save_config(changes)
+
+            # Reconfigure only the components affected by the changed keys
+            self._dispatch(changes)
+            self.logger.info(f"Configuration changed: {', '.join(sorted(changes))}")
             return True, "Configuration updated successfully"
         except Exception as e:
             return False, f"Error updating configuration: {str(e)}"
+
+    def _stat_config_file(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.config_file)
+            return (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            return None
+
+    def check_for_changes(self) -> bool:
+        """Apply external edits to the config file; a stat() call when nothing changed"""
+        with self._lock:
+            signature = self._stat_config_file()
+            if signature is None or signature == self._file_signature:
+                return False
+            self._file_signature = signature
+            try:
+                with open(self.config_file, 'r') as f:
+                    config_data = yaml.safe_load(f) or {}
+            except Exception as e:
+                self.logger.error(f"Error reading edited configuration: {str(e)}")
+                return False
+            updates = {k: v for k, v in config_data.items() if hasattr(self.config, k)}
+            success, message = self._update_config(updates, save=False)
+            if not success:
+                self.logger.error(f"Ignoring edited configuration: {message}")
+            return success
+
+    def start_watching(self, interval: float = 2.0) -> None:
+        """Poll the config file for external edits in a background thread"""
+        if self._watch_thread and self._watch_thread.is_alive():
+            return
+        self._watch_stop.clear()
+
+        def watch():
+            while not self._watch_stop.wait(interval):
+                self.check_for_changes()
+
+        self._watch_thread = threading.Thread(target=watch, name='ConfigWatcher', daemon=True)
+        self._watch_thread.start()
+
+    def stop_watching(self) -> None:
+        self._watch_stop.set()
     
     def _validate_value(self, key: str, value: Any) -> bool:
         """Validate configuration values"""
@@ -129,10 +421,37 @@ class ConfigurationManager:
             if key.endswith('_PIN'):
                 return 0 <= value <= 27  # Valid GPIO pins on Raspberry Pi
             
+            # Sensor registry validation
+            if key == 'SENSORS':
+                SensorRegistry(value)
+                return True
+
             # Interval validation
             if key.endswith('_INTERVAL'):
                 return value > 0
             
+            # Watchdog validation
+            if key in ('WATCHDOG_TIMEOUT', 'HARDWARE_READY_TIMEOUT'):
+                return value > 0
+            
+            # Web server validation
+            if key == 'WEB_SERVER':
+                return value in ('pool', 'werkzeug')
+            if key in ('WEB_THREADS', 'WEB_STREAM_THREADS', 'WEB_MAX_CONNECTIONS'):
+                return value >= 1
+            if key in ('WEB_KEEPALIVE_TIMEOUT', 'WEB_REQUEST_TIMEOUT', 'WEB_HEADER_TIMEOUT'):
+                return value > 0
+            
+            # Process validation
+            if key == 'WEB_WORKERS':
+                return 0 <= value <= 16
+            if key == 'FRAME_RING_SLOTS':
+                return 2 <= value <= 64
+            
+            # Size validation
+            if key.endswith('_BYTES'):
+                return value > 0
+            
             # Path validation
             if key.endswith('_DIR'):
                 return isinstance(value, str) and len(value) > 0
@@ -145,10 +464,18 @@ class ConfigurationManager:
             if key == 'IMAGE_QUALITY':
                 return 0 <= value <= 100
             
+            # Frame rate validation
+            if key == 'CAMERA_FRAMERATE':
+                return 0 < value <= 120
+            
             # Sensitivity validation
             if key == 'MOTION_DETECTION_SENSITIVITY':
                 return 0 <= value <= 100
             
+            # Log format validation
+            if key == 'LOG_FORMAT':
+                return value in ('text', 'json')
+            
             # Email validation
             if key == 'NOTIFICATION_EMAIL':
                 return '@' in value if value else True
@@ -165,13 +492,12 @@ class ConfigurationManager:
         """Restore configuration from backup"""
         try:
             backup_path = os.path.join(self.config.BACKUP_DIR, backup_file)
-            if not os.path.exists(backup_path):
+            if os.path.basename(backup_file) != backup_file or not os.path.exists(backup_path):
                 return False, "Backup file not found"
             
-            with open(backup_path, 'r') as f:
-                backup_data = yaml.safe_load(f)
+            backup_data = self._read_backup_file(backup_file)
             
-            success, message = self.update_config(backup_data)
+            success, message = self.update_config(dict(backup_data))
             if success:
                 return True, "Configuration restored successfully"
             return False, f"Error restoring configuration: {message}"
@@ -179,11 +505,13 @@ class ConfigurationManager:
             return False, f"Error restoring backup: {str(e)}"
     
     def list_backups(self) -> list[str]:
-        """List available configuration backups"""
-        try:
-            if not os.path.exists(self.config.BACKUP_DIR):
-                return []
-            return [f for f in os.listdir(self.config.BACKUP_DIR) 
-                   if f.startswith('config_backup_') and f.endswith('.yaml')]
-        except Exception:
-            return []
\ No newline at end of file
+        """List available configuration backups, newest first (served from the index)"""
+        if self._backup_list is None:
+            seen = set()
+            backups = []
+            for entry in reversed(self._load_backup_index()):
+                if entry['file'] not in seen:
+                    seen.add(entry['file'])
+                    backups.append(entry['file'])
+            self._backup_list = backups
+        return self._backup_list
\ No newline at end of file
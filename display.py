@@ -0,0 +1,127 @@
+import logging
+import threading
+from time import perf_counter
+from metrics import LCD_RENDER_TIME
+
+
+class LCDRenderer(object):
+    """Drives the LCD from its own thread through a single-slot mailbox.
+
+    Producers call post() with the wanted screen lines; it never blocks on the
+    bus. If a newer screen is posted before the worker picks up the previous
+    one, the older one is dropped (latest state wins). The worker renders at
+    most once per min_interval seconds. A failed render stays pending and is
+    retried with exponential backoff up to max_backoff seconds. Each render is watched by `watchdog`
+    when one is given, as a non-critical component: the LCD is optional, so
+    a hung bus call degrades health without failing liveness.
+    """
+
+    def __init__(self, lcd, min_interval=0.5, logger=None, watchdog=None, max_backoff=30.0):
+        self.lcd = lcd
+        self.min_interval = min_interval
+        self.max_backoff = max_backoff
+        self.backoff = 0.0  # extra wait after a failed render, 0 while the bus is healthy
+        self.logger = logger or logging.getLogger('SecurityMonitor')
+        self.watchdog = watchdog
+        self.condition = threading.Condition()
+        self.pending = None
+        self.running = False
+        self.thread = None
+        self.last_render = 0.0
+
+        # Counters, read through stats()
+        self.posted = 0
+        self.rendered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.cells_written = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self.last_render_time = 0.0
+        self.max_render_time = 0.0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='LCDRenderer')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        """Stop the worker. Returns False if it is stuck in a bus call"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join(timeout)
+            return not self.thread.is_alive()
+        return True
+
+    def post(self, lines):
+        with self.condition:
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = (tuple(lines), perf_counter())
+            self.posted += 1
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and self.pending is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                # Rate limit; anything posted meanwhile replaces the pending screen
+                delay = self.last_render + max(self.min_interval, self.backoff) - perf_counter()
+                while self.running and delay > 0:
+                    self.condition.wait(delay)
+                    delay = self.last_render + max(self.min_interval, self.backoff) - perf_counter()
+                if not self.running:
+                    return
+                lines, posted_at = self.pending
+                self.pending = None
+
+            started = perf_counter()
+            try:
+                if self.watchdog:
+                    with self.watchdog.watch('display', critical=False):
+                        self.cells_written += self.lcd.render(lines)
+                else:
+                    self.cells_written += self.lcd.render(lines)
+            except Exception as e:
+                self.errors += 1
+                self.backoff = min(self.max_backoff, max(self.min_interval, self.backoff * 2))
+                self.logger.error(f"Display Render Error: {str(e)} - retrying in {self.backoff:.1f}s")
+                with self.condition:
+                    # The LCD resyncs on its next render; redraw these lines unless newer ones came
+                    if self.pending is None:
+                        self.pending = (lines, posted_at)
+                self.last_render = perf_counter()
+                continue
+            finished = perf_counter()
+
+            self.backoff = 0.0
+            self.last_render = finished
+            self.rendered += 1
+            self.last_render_time = finished - started
+            LCD_RENDER_TIME.observe(self.last_render_time)
+            self.max_render_time = max(self.max_render_time, self.last_render_time)
+            self.last_latency = finished - posted_at
+            self.max_latency = max(self.max_latency, self.last_latency)
+            self.total_latency += self.last_latency
+
+    def stats(self):
+        return {
+            'posted': self.posted,
+            'rendered': self.rendered,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'cells_written': self.cells_written,
+            'last_latency': self.last_latency,
+            'max_latency': self.max_latency,
+            'avg_latency': self.total_latency / self.rendered if self.rendered else 0.0,
+            'last_render_time': self.last_render_time,
+            'max_render_time': self.max_render_time,
+        }
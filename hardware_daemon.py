@@ -0,0 +1,419 @@
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from time import monotonic, sleep
+from config import Config
+from heartbeats import Watchdog
+from logger import setup_logger
+from metrics import merge_families, registry
+from profiling import profiler, stage_timers
+from shared_frames import FrameRing, SharedFrameOutput
+from web_server import serve
+
+STATE_INTERVAL = 1.0  # seconds between readiness/health snapshots sent to the workers
+CALL_TIMEOUT = 5.0    # seconds a worker waits for the daemon to answer a call
+
+
+class StatusLink(object):
+    """Newline-delimited JSON messages over one end of a Unix socketpair.
+
+    send() never blocks: messages queue for a sender thread and are dropped
+    when a slow peer lets the queue fill up.
+    """
+
+    def __init__(self, sock, name, queue_size=1000):
+        self.sock = sock
+        self.name = name
+        self.outgoing = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._send_loop, name=f'StatusLink-{name}', daemon=True)
+        self.thread.start()
+
+    def send(self, message):
+        try:
+            self.outgoing.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+
+    def _send_loop(self):
+        while True:
+            message = self.outgoing.get()
+            try:
+                self.sock.sendall((json.dumps(message, default=str) + '\n').encode('utf-8'))
+            except OSError:
+                return
+
+    def messages(self):
+        """Incoming messages until the peer goes away"""
+        with self.sock.makefile('r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+class LinkLogHandler(logging.Handler):
+    """Forwards a web worker's records to the daemon, which owns the log file"""
+
+    def __init__(self, link, worker):
+        super().__init__()
+        self.link = link
+        self.worker = worker
+
+    def emit(self, record):
+        try:
+            self.link.send({'log': {
+                'name': record.name,
+                'levelno': record.levelno,
+                'levelname': record.levelname,
+                'msg': f"[{self.worker}] {record.getMessage()}",
+                'created': record.created,
+                'pathname': record.pathname,
+                'lineno': record.lineno,
+                'funcName': record.funcName,
+                'exc_text': self.formatter.formatException(record.exc_info) if record.exc_info else None,
+            }})
+        except Exception:
+            self.handleError(record)
+
+
+class RemoteReadiness(object):
+    """Readiness of the daemon's hardware, as last reported over the link"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.components = {}
+
+    def update(self, status):
+        with self.condition:
+            self.components = status
+            self.condition.notify_all()
+
+    def wait(self, name, timeout=None):
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.components.get(name, {}).get('state') in ('ready', 'failed'), timeout)
+            return self.is_ready(name)
+
+    def is_ready(self, name):
+        return self.components.get(name, {}).get('state') == 'ready'
+
+    def ready(self):
+        required = [name for name, s in self.components.items() if s['required']]
+        return bool(required) and all(self.is_ready(name) for name in required)
+
+    def status(self):
+        return dict(self.components)
+
+
+class DaemonClient(object):
+    """A web worker's calls into the hardware daemon: metrics, stage timers and
+    the profiler there cover the monitor loop, captures and the LCD, which no
+    worker runs. Replies arrive through RemoteMonitor.follow."""
+
+    def __init__(self, link, name, hardware_metrics=()):
+        self.link = link
+        self.name = name
+        self.hardware_metrics = frozenset(hardware_metrics)  # the daemon exports these
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, op, **args):
+        """Send a call; returns (call id, Future of the result)"""
+        future = Future()
+        with self._lock:
+            call_id = next(self._ids)
+            self._pending[call_id] = future
+        self.link.send({'call': {'id': call_id, 'op': op, 'args': args}})
+        return call_id, future
+
+    def wait(self, call_id, future, timeout):
+        try:
+            return future.result(timeout)
+        finally:
+            with self._lock:
+                self._pending.pop(call_id, None)
+
+    def call(self, op, timeout=CALL_TIMEOUT, **args):
+        return self.wait(*self.submit(op, **args), timeout)
+
+    def resolve(self, reply):
+        with self._lock:
+            future = self._pending.pop(reply['id'], None)
+        if future is None:
+            return  # the caller gave up waiting
+        if reply.get('error'):
+            future.set_exception(RuntimeError(reply['error']))
+        else:
+            future.set_result(reply.get('result'))
+
+    def local_metrics(self):
+        return registry.collect(exclude=self.hardware_metrics)
+
+    def push_metrics(self):
+        """Keep the daemon's copy of this worker's metrics current, for scrapes other workers answer"""
+        while True:
+            self.link.send({'metrics': self.local_metrics()})
+            sleep(STATE_INTERVAL)
+
+    def metrics(self):
+        """The daemon's series as they are, every worker's with a worker label"""
+        snapshot = self.call('metrics')
+        workers = dict(snapshot['workers'])
+        workers[self.name] = self.local_metrics()
+        return merge_families((snapshot['daemon'], {}),
+                              *((families, {'worker': name}) for name, families in sorted(workers.items())))
+
+    def stages(self, enabled=None, reset=False):
+        """Control the stage timers of every process; stats are the daemon's plus this worker's"""
+        stage_timers.control(enabled, reset)
+        result = self.call('stages', enabled=enabled, reset=reset)
+        stats = result['stages']
+        for name, local in stage_timers.stats().items():
+            merged = stats.setdefault(name, {'calls': 0, 'total': 0.0, 'max': 0.0})
+            merged['calls'] += local['calls']
+            merged['total'] += local['total']
+            merged['max'] = max(merged['max'], local['max'])
+            merged['avg'] = merged['total'] / merged['calls'] if merged['calls'] else 0.0
+        return result['enabled'], stats
+
+    def profile(self, seconds, interval):
+        """Sample the daemon and this worker together; stacks start with the process name"""
+        call_id, future = self.submit('profile', seconds=seconds, interval=interval)
+        stacks = Counter({f"{self.name};{stack}": count
+                          for stack, count in profiler.profile(seconds, interval).items()})
+        remote = self.wait(call_id, future, seconds + CALL_TIMEOUT)
+        stacks.update({f"daemon;{stack}": count for stack, count in remote.items()})
+        return stacks
+
+
+class RemoteMonitor(object):
+    """Stands in for the SecurityMonitor inside a web worker: frames come from
+    shared memory, events and hardware state from the daemon's link"""
+
+    def __init__(self, output, status_queue, daemon):
+        self.output = output
+        self.status_queue = status_queue
+        self.daemon = daemon
+        self.camera = None
+        self.readiness = RemoteReadiness()
+        self.watchdog = Watchdog(Config.WATCHDOG_TIMEOUT, sd_notify=False)  # this worker's streams
+        self.state = {}
+
+    def follow(self, link):
+        """Apply the daemon's messages; the worker exits once the daemon is gone"""
+        for message in link.messages():
+            if 'event' in message:
+                self.status_queue.put(message['event'])
+            elif 'state' in message:
+                self.state = message['state']
+                self.readiness.update(self.state.get('readiness', {}))
+            elif 'reply' in message:
+                self.daemon.resolve(message['reply'])
+            elif 'stages' in message:
+                stage_timers.control(**message['stages'])  # switched from another worker
+        print(f"Hardware daemon went away, stopping web worker {os.getpid()}")
+        os._exit(0)
+
+    def get_display_stats(self):
+        return self.state.get('display', {})
+
+    def get_bus_stats(self):
+        return self.state.get('buses', {})
+
+    def get_watchdog_stats(self):
+        stats = dict(self.state.get('watchdog', {}))
+        stats.update(self.watchdog.stats())
+        return stats
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+class HardwareDaemon(object):
+    """Runs the SecurityMonitor in this process and the web app in `workers`
+    forked processes that share one listening socket.
+
+    JPEG frames reach the workers through a FrameRing in shared memory, so
+    viewers cost the daemon nothing per client. Status events and hardware
+    state go out over a socketpair per worker; the workers' log records come
+    back over the same socket.
+    """
+
+    def __init__(self, app, workers, host='0.0.0.0', port=5000):
+        self.app = app
+        self.workers = workers
+        self.logger = logging.getLogger('SecurityMonitor')
+        self.listener = socket.create_server((host, port), backlog=128)
+        self.ring = FrameRing(Config.FRAME_RING_SLOTS, Config.FRAME_SLOT_BYTES)
+        self.links = []
+        self.processes = []
+        self.worker_metrics = {}  # worker name -> its last pushed metrics snapshot
+        self.monitor = None
+        self.stopping = False
+
+    def start_workers(self):
+        # Fork before the hardware threads exist, so workers never inherit them
+        context = multiprocessing.get_context('fork')
+        for i in range(self.workers):
+            name = f'web-{i + 1}'
+            ours, theirs = socket.socketpair()
+            process = context.Process(target=self._worker_main, args=(name, theirs), name=name, daemon=True)
+            process.start()
+            theirs.close()
+            self.links.append(StatusLink(ours, name))
+            self.processes.append(process)
+        self.logger.info(f"Started {self.workers} web workers on {self.listener.getsockname()}")
+
+    def _worker_main(self, name, sock):
+        # Stop signals go to the whole process group; the daemon cleans up the
+        # hardware first and then ends the workers by closing their links
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for link in self.links:
+            link.sock.close()  # other workers' links: keep EOF detection working
+        link = StatusLink(sock, name)
+        setup_logger(LinkLogHandler(link, name))
+
+        output = SharedFrameOutput(self.ring, 0.5 / max(1, Config.CAMERA_FRAMERATE))
+        client = DaemonClient(link, name, self.app.hardware_metrics)
+        remote = RemoteMonitor(output, self.app.status_queue, client)
+        remote.watchdog.start()
+        threading.Thread(target=remote.follow, args=(link,), name='DaemonLink', daemon=True).start()
+        threading.Thread(target=client.push_metrics, name='MetricsPush', daemon=True).start()
+
+        self.app.daemon = client
+        self.app.security_monitor = remote
+        self.app.monitor_ready = Future()
+        self.app.monitor_ready.set_result(remote)
+        self.app.config_manager.start_watching()
+        host, port = self.listener.getsockname()[:2]
+        serve(self.app, host, port, fd=self.listener.fileno())
+
+    def _receive(self, link):
+        """Re-log a worker's records through the daemon's file handler, keep its
+        metrics and answer its calls"""
+        for message in link.messages():
+            if 'log' in message:
+                self.logger.handle(logging.makeLogRecord(message['log']))
+            elif 'metrics' in message:
+                self.worker_metrics[link.name] = message['metrics']
+            elif 'call' in message:
+                # Calls may take a while (a profile runs for seconds): one thread each
+                threading.Thread(target=self._answer, args=(link, message['call']),
+                                 name=f'DaemonCall-{link.name}', daemon=True).start()
+        self.worker_metrics.pop(link.name, None)
+        if not self.stopping:
+            self.logger.error(f"Lost the link to web worker {link.name}")
+
+    def _answer(self, link, call):
+        ops = {'metrics': self.metrics_snapshot, 'stages': self.control_stages, 'profile': self.profile}
+        try:
+            if call['op'] not in ops:
+                raise ValueError(f"Unknown call {call['op']}")
+            reply = {'id': call['id'], 'result': ops[call['op']](**call.get('args', {}))}
+        except Exception as e:
+            reply = {'id': call['id'], 'error': str(e)}
+        link.send({'reply': reply})
+
+    def metrics_snapshot(self):
+        return {'daemon': registry.collect(), 'workers': dict(self.worker_metrics)}
+
+    def control_stages(self, enabled=None, reset=False):
+        stage_timers.control(enabled, reset)
+        if enabled is not None or reset:
+            self._broadcast({'stages': {'enabled': enabled, 'reset': reset}})
+        return {'enabled': stage_timers.enabled, 'stages': stage_timers.stats()}
+
+    def profile(self, seconds, interval):
+        return dict(profiler.profile(seconds, interval))
+
+    def _publish(self):
+        """Fan status events out to every worker, plus a state snapshot each STATE_INTERVAL"""
+        next_state = 0.0
+        while True:
+            try:
+                event = self.monitor.status_queue.get(timeout=max(0.0, next_state - monotonic()))
+                self._broadcast({'event': event})
+            except queue.Empty:
+                pass
+            if monotonic() >= next_state:
+                self._broadcast({'state': self.monitor_state()})
+                next_state = monotonic() + STATE_INTERVAL
+
+    def _broadcast(self, message):
+        for link in self.links:
+            link.send(message)
+
+    def monitor_state(self):
+        try:
+            return {
+                'readiness': self.monitor.readiness.status(),
+                'watchdog': self.monitor.get_watchdog_stats(),
+                'display': self.monitor.get_display_stats(),
+                'buses': self.monitor.get_bus_stats(),
+                'frames': self.ring.published(),
+            }
+        except Exception as e:
+            self.logger.error(f"Daemon state Error: {str(e)}")
+            return {}
+
+    def _attach_camera(self):
+        if self.monitor.readiness.wait('camera', Config.HARDWARE_READY_TIMEOUT):
+            self.monitor.output.sinks.append(self.ring.write)
+            self.logger.info(f"Publishing frames to shared memory {self.ring.name}")
+        else:
+            self.logger.error("Camera not available - web workers will have no video")
+
+    def _supervise(self):
+        for process in self.processes:
+            process.join()
+            if not self.stopping:
+                self.logger.error(f"Web worker {process.name} exited with code {process.exitcode}")
+        if not self.stopping:
+            self.logger.error("All web workers have exited")
+
+    def run(self, init_monitor):
+        """Fork the workers, start the hardware and run the monitor loop until it stops"""
+        self.start_workers()
+        # systemd stops services with SIGTERM: let the monitor clean up as on Ctrl-C
+        signal.signal(signal.SIGTERM, _interrupt)
+        try:
+            self.monitor = init_monitor(self.app)
+            for link in self.links:
+                threading.Thread(target=self._receive, args=(link,), name=f'WorkerLog-{link.name}',
+                                 daemon=True).start()
+            for target in (self._publish, self._attach_camera, self._supervise):
+                threading.Thread(target=target, name=f'Daemon{target.__name__}', daemon=True).start()
+            self.monitor.run()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stopping = True
+        output = getattr(self.monitor, 'output', None)
+        if output is not None and self.ring.write in output.sinks:
+            output.sinks.remove(self.ring.write)
+        for link in self.links:
+            try:
+                link.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for process in self.processes:
+            process.join(5.0)
+            if process.is_alive():
+                process.kill()
+        self.listener.close()
+        self.ring.close()
+        self.ring.unlink()
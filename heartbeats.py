@@ -0,0 +1,181 @@
+import logging
+import os
+import socket
+import sys
+import threading
+import traceback
+from contextlib import contextmanager
+from time import monotonic
+from metrics import registry
+
+
+def sd_notify(state, address=None):
+    """Send a state string to systemd's notify socket; False if not under systemd"""
+    address = address or os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return False
+    if address.startswith('@'):
+        address = '\0' + address[1:]  # abstract namespace socket
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)  # never let a full notify queue block the watchdog thread
+            sock.connect(address)
+            sock.sendall(state.encode('ascii'))
+        return True
+    except OSError:
+        return False
+
+
+class Watchdog(object):
+    """Stall detector for threads that report heartbeats.
+
+    Each watched component calls heartbeat(name) from its own thread. A
+    checker thread flags a component once it has gone `timeout` seconds
+    without a beat: it grabs that thread's stack, logs it and hands a stall
+    event to on_stall. While no critical component is stalled it also pets
+    systemd's watchdog (WATCHDOG=1), so a wedged process gets restarted by
+    systemd. Non-critical components (optional peripherals, per-client
+    streams) only show up as degraded in stats() and are logged once.
+    """
+
+    def __init__(self, timeout=5.0, on_stall=None, sd_notify=True, logger=None):
+        self.timeout = timeout
+        self.on_stall = on_stall
+        self.sd_notify = sd_notify
+        self.logger = logger or logging.getLogger('SecurityMonitor')
+        self._beats = {}  # name -> [last beat, thread ident, own timeout or None, stalled since]
+        self._stats = {}  # name -> [stalls, last duration, max duration]
+        self._critical = {}  # name -> whether a stall fails liveness
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(self, name, timeout=None, critical=True):
+        """Start watching name; the calling thread is the one it reports on"""
+        with self._lock:
+            self._beats[name] = [monotonic(), threading.get_ident(), timeout, None]
+            self._stats.setdefault(name, [0, 0.0, 0.0])
+            self._critical[name] = critical
+
+    def unregister(self, name):
+        with self._lock:
+            beat = self._beats.pop(name, None)
+        if beat is not None and beat[3] is not None:
+            self._recovered(name, beat, monotonic())
+
+    def heartbeat(self, name):
+        beat = self._beats.get(name)
+        if beat is None:
+            self.register(name)
+        else:
+            beat[0] = monotonic()
+            beat[1] = threading.get_ident()
+
+    @contextmanager
+    def watch(self, name, timeout=None, critical=True):
+        """Watch a single operation, e.g. one capture, for as long as it runs"""
+        self.register(name, timeout, critical)
+        try:
+            yield
+        finally:
+            self.unregister(name)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='Watchdog', daemon=True)
+            self._thread.start()
+            if self.sd_notify:
+                sd_notify('READY=1')
+        return self
+
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        interval = max(0.05, self.timeout / 4.0)
+        while not self._stop.wait(interval):
+            try:
+                stalled = self.check()
+                if self.sd_notify and not any(self._critical.get(name, True) for name in stalled):
+                    sd_notify('WATCHDOG=1')
+            except Exception as e:
+                self.logger.error(f"Watchdog Error: {str(e)}")
+
+    def check(self, now=None):
+        """Flag new stalls and close recovered ones; returns the stalled names"""
+        if now is None:
+            now = monotonic()
+        with self._lock:
+            beats = list(self._beats.items())
+        stalled = []
+        for name, beat in beats:
+            last, ident, timeout, since = beat
+            if now - last < (timeout or self.timeout):
+                if since is not None:
+                    self._recovered(name, beat, last)
+                continue
+            stalled.append(name)
+            if since is None:
+                beat[3] = last
+                self._stalled(name, ident, now - last)
+        return stalled
+
+    def _stalled(self, name, ident, age):
+        with self._lock:
+            self._stats[name][0] += 1
+            critical = self._critical.get(name, True)
+        if not critical:
+            self.logger.warning(f"Watchdog: {name} has not reported for {age:.1f}s (degraded)")
+            return
+        frame = sys._current_frames().get(ident)
+        stack = ''.join(traceback.format_stack(frame)) if frame else 'thread not running'
+        self.logger.error(f"Watchdog: {name} has not reported for {age:.1f}s\n{stack}")
+        if self.on_stall:
+            self.on_stall({'component': name, 'stalled_for': age, 'stack': stack})
+
+    def _recovered(self, name, beat, resumed_at):
+        duration = resumed_at - beat[3]
+        beat[3] = None
+        with self._lock:
+            stats = self._stats[name]
+            stats[1] = duration
+            stats[2] = max(stats[2], duration)
+        if self._critical.get(name, True):
+            self.logger.warning(f"Watchdog: {name} recovered after {duration:.1f}s")
+
+    def stats(self):
+        now = monotonic()
+        with self._lock:
+            beats = dict(self._beats)
+            return {
+                name: {
+                    'stalls': stalls,
+                    'stalled': name in beats and beats[name][3] is not None,
+                    'critical': self._critical.get(name, True),
+                    'last_beat_age': now - beats[name][0] if name in beats else None,
+                    'last_stall_duration': last,
+                    'max_stall_duration': worst,
+                }
+                for name, (stalls, last, worst) in self._stats.items()
+            }
+
+
+def register_watchdog_metrics(get_stats):
+    """Export the stall counters get_stats() returns, in Watchdog.stats() form"""
+    def read(key):
+        def values():
+            stats = get_stats()
+            if stats is None:
+                return None
+            return {(('component', name),): float(s[key]) for name, s in stats.items()}
+        return values
+
+    registry.callback('security_watchdog_stalls_total', 'Heartbeat stalls detected', read('stalls'), 'counter')
+    registry.callback('security_watchdog_stalled', 'Components currently stalled', read('stalled'))
+    registry.callback('security_watchdog_critical', 'Components whose stalls fail liveness (others degrade)',
+                      read('critical'))
+    registry.callback('security_watchdog_max_stall_seconds', 'Longest stall seen per component',
+                      read('max_stall_duration'))
@@ -0,0 +1,214 @@
+import io
+import os
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+from time import sleep
+
+import smbus
+
+I2C_SLAVE = 0x0703          # ioctl: set the target address of a raw i2c-dev handle
+I2C_BLOCK_MAX = 32          # SMBus block writes carry at most 32 data bytes
+
+
+class I2CBusError(IOError):
+    pass
+
+
+class I2CBus(object):
+    """Process-wide owner of one I2C bus.
+
+    All devices share a single SMBus handle (plus one raw i2c-dev handle for
+    long writes). Every transaction runs under one lock and transient bus
+    errors are retried with exponential backoff. Byte streams are only
+    retried when the caller says replaying them from the start is harmless.
+
+    Writes can be queued per device address and flushed together as one
+    transaction per device: explicitly with queue()/flush(), or by making
+    them inside a batch() block, where every write is coalesced that way.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, busnum=1):
+        with cls._instances_lock:
+            bus = cls._instances.get(busnum)
+            if bus is None:
+                bus = cls._instances[busnum] = cls(busnum)
+            return bus
+
+    @classmethod
+    def opened(cls):
+        """Buses opened so far, without opening any new ones"""
+        with cls._instances_lock:
+            return dict(cls._instances)
+
+    def __init__(self, busnum=1, retries=3, backoff=0.005):
+        self.busnum = busnum
+        self.retries = retries
+        self.backoff = backoff
+        self.logger = logging.getLogger('SecurityMonitor')
+        self.lock = threading.RLock()
+        self.bus = smbus.SMBus(busnum)
+        self.raw = self._open_raw()
+        self.raw_address = None
+        self.queued = {}  # address -> [bytes, retry]
+        self.batching = 0
+        self.transactions = 0
+        self.errors = 0
+        self.retried = 0
+
+    def _open_raw(self):
+        try:
+            # O_WRONLY without O_CREAT: never create a plain file if the device is missing
+            return io.FileIO(os.open('/dev/i2c-%d' % self.busnum, os.O_WRONLY), 'wb')
+        except (IOError, OSError):
+            return None
+
+    def _call(self, func, *args, retries=None):
+        if retries is None:
+            retries = self.retries
+        attempt = 0
+        while True:
+            try:
+                with self.lock:
+                    result = func(*args)
+                    self.transactions += 1
+                    return result
+            except (IOError, OSError) as e:
+                self.errors += 1
+                if attempt >= retries:
+                    raise I2CBusError(f"I2C bus {self.busnum} error after {attempt + 1} attempts: {e}")
+                self.retried += 1
+                sleep(self.backoff * (2 ** attempt))
+                attempt += 1
+
+    def probe(self, address):
+        """True if a device acknowledges at address"""
+        try:
+            self._call(self.bus.read_byte, address)
+            return True
+        except I2CBusError:
+            return False
+
+    def read_byte(self, address):
+        return self._call(self.bus.read_byte, address)
+
+    def read_byte_data(self, address, register):
+        return self._call(self.bus.read_byte_data, address, register)
+
+    def read_i2c_block_data(self, address, register, length):
+        return self._call(self.bus.read_i2c_block_data, address, register, length)
+
+    def write_byte(self, address, value):
+        with self.lock:
+            if self.batching:
+                self.queue(address, (value,))
+                return
+            self._flush_before(address)
+            self._call(self.bus.write_byte, address, value)
+
+    def write_byte_data(self, address, register, value):
+        self._call(self.bus.write_byte_data, address, register, value)
+
+    def _write_stream(self, address, data):
+        if self.raw is not None and self.raw_address != address:
+            try:
+                fcntl.ioctl(self.raw, I2C_SLAVE, address)
+            except (IOError, OSError) as e:
+                # e.g. EBUSY when a kernel driver claims the address
+                self.logger.warning(f"Raw I2C access unavailable, using SMBus block writes: {str(e)}")
+                self.raw.close()
+                self.raw = None
+            else:
+                self.raw_address = address
+        if self.raw is not None:
+            self.raw.write(data)
+        else:
+            self._write_chunks(address, data)
+
+    def _write_chunks(self, address, data):
+        # Byte-stream devices (PCF8574 and friends) latch every byte, so the
+        # SMBus "command" byte is just the first byte of each chunk
+        for i in range(0, len(data), I2C_BLOCK_MAX + 1):
+            chunk = data[i:i + I2C_BLOCK_MAX + 1]
+            if len(chunk) == 1:
+                self.bus.write_byte(address, chunk[0])
+            else:
+                self.bus.write_i2c_block_data(address, chunk[0], list(chunk[1:]))
+
+    def write_block(self, address, values, retry=True):
+        """Write a byte stream to a device, in one transaction when a raw handle is available.
+        A failed stream may have been partly latched; pass retry=False when
+        resending it from the first byte would corrupt the device state"""
+        data = bytes(values)
+        if not data:
+            return
+        with self.lock:
+            if self.batching:
+                self.queue(address, data, retry)
+                return
+            self._flush_before(address)
+            self._send(address, data, retry)
+
+    def _send(self, address, data, retry):
+        self._call(self._write_stream, address, data, retries=None if retry else 0)
+
+    def _flush_before(self, address):
+        # Bytes queued for a device go out before anything written to it directly
+        if address in self.queued:
+            self.flush(address)
+
+    def queue(self, address, values, retry=True):
+        """Append bytes for a device; they are sent by the next flush(). The
+        coalesced stream is only retried if every part of it may be"""
+        with self.lock:
+            entry = self.queued.setdefault(address, [bytearray(), True])
+            entry[0].extend(values)
+            entry[1] = entry[1] and retry
+
+    def flush(self, address=None):
+        """Send queued bytes, one transaction per device. Bytes of a failed
+        device are dropped, not re-queued"""
+        with self.lock:
+            if address is None:
+                pending, self.queued = self.queued, {}
+            else:
+                entry = self.queued.pop(address, None)
+                pending = {address: entry} if entry else {}
+            error = None
+            for addr, (data, retry) in pending.items():
+                try:
+                    if data:
+                        self._send(addr, bytes(data), retry)
+                except I2CBusError as e:
+                    error = error or e  # still send the other devices' bytes
+            if error:
+                raise error
+
+    @contextmanager
+    def batch(self):
+        """Hold the bus and coalesce every write made inside the block, flushing on exit.
+        If the block raises, nothing queued is sent"""
+        with self.lock:
+            self.batching += 1
+            try:
+                yield self
+            except BaseException:
+                if self.batching == 1:
+                    self.queued.clear()
+                raise
+            finally:
+                self.batching -= 1
+            if not self.batching:
+                self.flush()
+
+    def stats(self):
+        return {
+            'transactions': self.transactions,
+            'errors': self.errors,
+            'retried': self.retried,
+        }
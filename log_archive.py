@@ -0,0 +1,261 @@
+import glob
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import zlib
+from bisect import bisect_right
+from datetime import datetime
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+
+# Uncompressed bytes per gzip member; one index entry per member
+BLOCK_SIZE = 64 * 1024
+INDEX_SUFFIX = '.idx'
+
+_TEXT_RECORD = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),(\d{3}) - \S+ - ([A-Z]+) - ')
+_SEGMENT_STAMP = '%Y%m%d-%H%M%S-%f'
+
+
+def _levelno(name):
+    level = logging.getLevelName(name)
+    return level if isinstance(level, int) else 0
+
+
+def parse_record_start(line):
+    """(epoch seconds, levelno) if line starts a log record, None for continuation lines"""
+    if line.startswith('{'):
+        try:
+            entry = json.loads(line)
+            return datetime.fromisoformat(entry['ts']).timestamp(), _levelno(entry['level'])
+        except (ValueError, KeyError, TypeError):
+            return None
+    match = _TEXT_RECORD.match(line)
+    if match is None:
+        return None
+    stamp = datetime.strptime(match.group(1), '%Y-%m-%d %H:%M:%S')
+    return stamp.timestamp() + int(match.group(2)) / 1000.0, _levelno(match.group(3))
+
+
+def iter_records(lines):
+    """Group lines into (ts, levelno, text) records; tracebacks stay with their record"""
+    ts, level, parts = None, 0, []
+    for line in lines:
+        start = parse_record_start(line)
+        if start is not None:
+            if parts:
+                yield ts, level, ''.join(parts)
+            (ts, level), parts = start, [line]
+        else:
+            parts.append(line)
+    if parts:
+        yield ts, level, ''.join(parts)
+
+
+def compress_segment(path):
+    """Write path as path.gz made of independent gzip members plus a sparse index,
+    then remove path. Each index entry is [first timestamp, offset, highest level]."""
+    gz_path = path + '.gz'
+    blocks = []
+    with open(path, 'r', encoding='utf-8', errors='replace') as src, open(gz_path + '.tmp', 'wb') as dst:
+        block, block_ts, block_level, size = [], None, 0, 0
+        last_ts = 0.0
+
+        def flush():
+            data = ''.join(block).encode('utf-8')
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            blocks.append([block_ts if block_ts is not None else last_ts, dst.tell(), block_level])
+            dst.write(compressor.compress(data) + compressor.flush())
+
+        for ts, level, text in iter_records(src):
+            if size >= BLOCK_SIZE:
+                flush()
+                block, block_ts, block_level, size = [], None, 0, 0
+            if block_ts is None and ts is not None:
+                block_ts = ts
+            if ts is not None:
+                last_ts = ts
+            block.append(text)
+            block_level = max(block_level, level)
+            size += len(text)
+        if block:
+            flush()
+        end = dst.tell()
+
+    index = {'version': 1, 'end_ts': last_ts, 'size': end, 'blocks': blocks}
+    with open(gz_path + INDEX_SUFFIX + '.tmp', 'w') as f:
+        json.dump(index, f)
+    os.replace(gz_path + '.tmp', gz_path)
+    os.replace(gz_path + INDEX_SUFFIX + '.tmp', gz_path + INDEX_SUFFIX)
+    os.remove(path)
+    return gz_path
+
+
+def list_segments(base_filename, compressed=True):
+    """Rotated segment paths of a log file, oldest first"""
+    paths = []
+    for path in glob.glob(glob.escape(base_filename) + '.*'):
+        name = path[len(base_filename) + 1:]
+        if name.endswith(('.tmp', INDEX_SUFFIX)) or compressed != name.endswith('.gz'):
+            continue
+        try:
+            datetime.strptime(name[:-3] if compressed else name, _SEGMENT_STAMP)
+        except ValueError:
+            continue
+        paths.append(path)
+    return sorted(paths)
+
+
+@lru_cache(maxsize=256)
+def _read_index(path, signature):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _index_for(gz_path):
+    index_path = gz_path + INDEX_SUFFIX
+    try:
+        st = os.stat(index_path)
+    except OSError:
+        return None
+    return _read_index(index_path, (st.st_mtime_ns, st.st_size))
+
+
+class LogArchiver(object):
+    """Compresses rotated segments on its own thread and keeps the archive
+    under max_bytes by deleting the oldest segments"""
+
+    def __init__(self, base_filename, max_bytes):
+        self.base_filename = base_filename
+        self.max_bytes = max_bytes
+        self.pending = queue.Queue()
+        self.compressed = 0
+        self.errors = 0
+        self.thread = threading.Thread(target=self._run, name='LogArchiver', daemon=True)
+        self.thread.start()
+        # Segments left uncompressed by a crash or restart
+        for path in list_segments(base_filename, compressed=False):
+            self.submit(path)
+
+    def submit(self, path):
+        self.pending.put(path)
+
+    def _run(self):
+        while True:
+            path = self.pending.get()
+            if path is None:
+                return
+            try:
+                compress_segment(path)
+                self.compressed += 1
+                self.prune()
+            except Exception as e:
+                self.errors += 1
+                # Not through the SecurityMonitor logger: this runs inside its handler
+                print(f"Log archive error for {path}: {e}")
+
+    def prune(self):
+        archived = [(path, os.path.getsize(path)) for path in list_segments(self.base_filename)]
+        total = sum(size for _, size in archived)
+        for path, size in archived:
+            if total <= self.max_bytes:
+                break
+            for victim in (path, path + INDEX_SUFFIX):
+                if os.path.exists(victim):
+                    os.remove(victim)
+            total -= size
+
+    def stop(self, timeout=5.0):
+        self.pending.put(None)
+        self.thread.join(timeout)
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """Rolls over to timestamp-named segments that a LogArchiver compresses"""
+
+    def __init__(self, filename, maxBytes, archive_max_bytes, encoding='utf-8'):
+        super().__init__(filename, maxBytes=maxBytes, backupCount=0, encoding=encoding)
+        self.archiver = LogArchiver(self.baseFilename, archive_max_bytes)
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            segment = f"{self.baseFilename}.{datetime.now().strftime(_SEGMENT_STAMP)}"
+            os.rename(self.baseFilename, segment)
+            self.archiver.submit(segment)
+        if not self.delay:
+            self.stream = self._open()
+
+    def close(self):
+        super().close()
+        self.archiver.stop()
+
+
+def _matching(records, start, end, min_level, results, limit):
+    """Append matching records; returns False once past end or at the limit"""
+    for ts, level, text in records:
+        if ts is None or ts < start:
+            continue
+        if ts > end:
+            return False
+        if level >= min_level:
+            results.append({
+                'ts': datetime.fromtimestamp(ts).isoformat(timespec='milliseconds'),
+                'level': logging.getLevelName(level),
+                'line': text.rstrip('\n'),
+            })
+            if len(results) >= limit:
+                return False
+    return True
+
+
+def _search_segment(gz_path, start, end, min_level, results, limit):
+    index = _index_for(gz_path)
+    if index is None or not index['blocks'] or index['end_ts'] < start:
+        return True
+    if index['blocks'][0][0] > end:
+        return False
+    blocks = index['blocks']
+    first = max(0, bisect_right([b[0] for b in blocks], start) - 1)
+    with open(gz_path, 'rb') as f:
+        for i in range(first, len(blocks)):
+            ts, offset, max_level = blocks[i]
+            if ts > end:
+                return False
+            if max_level < min_level:
+                continue  # nothing at this level in the block: skip it unread
+            f.seek(offset)
+            stop = blocks[i + 1][1] if i + 1 < len(blocks) else index['size']
+            text = zlib.decompress(f.read(stop - offset), 31).decode('utf-8', 'replace')
+            if not _matching(iter_records(text.splitlines(True)), start, end, min_level, results, limit):
+                return False
+    return True
+
+
+def _search_plain(path, start, end, min_level, results, limit):
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return _matching(iter_records(f), start, end, min_level, results, limit)
+    except FileNotFoundError:
+        return True  # rotated or compressed while we were looking
+
+
+def search_logs(log_file, start=None, end=None, min_level=logging.NOTSET, limit=1000):
+    """Records logged between start and end (epoch seconds) at min_level or above,
+    oldest first. Compressed segments are read block by block via their index."""
+    start = float('-inf') if start is None else start
+    end = float('inf') if end is None else end
+    base = os.path.abspath(log_file)
+    results = []
+
+    paths = sorted([(p, True) for p in list_segments(base)] +
+                   [(p, False) for p in list_segments(base, compressed=False)])
+    for path, compressed in paths + [(base, False)]:
+        search = _search_segment if compressed else _search_plain
+        if not search(path, start, end, min_level, results, limit):
+            break
+    return results
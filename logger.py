@@ -1,26 +1,132 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from time import monotonic
 from config import Config
+from log_archive import CompressingRotatingFileHandler, search_logs
 
-def setup_logger():
+_listener = None
+_queue_handler = None
+_file_handler = None
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line, for log shipping and grep-free querying"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'site': f"{record.module}:{record.lineno}",
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class RateLimitFilter(logging.Filter):
+    """Let at most `limit` records per call site through every `window` seconds.
+
+    Warnings and errors always pass. The first record from a site after a
+    suppressed stretch notes how many were dropped.
+    """
+
+    def __init__(self, limit, window):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.sites = {}  # (pathname, lineno) -> [window start, count, suppressed]
+        self.lock = threading.Lock()
+        self.suppressed_total = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.limit <= 0:
+            return True
+        now = monotonic()
+        key = (record.pathname, record.lineno)
+        with self.lock:
+            site = self.sites.get(key)
+            if site is None:
+                site = self.sites[key] = [now, 0, 0]
+            elif now - site[0] >= self.window:
+                site[0] = now
+                site[1] = 0
+            if site[1] >= self.limit:
+                site[2] += 1
+                self.suppressed_total += 1
+                return False
+            site[1] += 1
+            suppressed, site[2] = site[2], 0
+        if suppressed:
+            record.msg = f"{record.getMessage()} [{suppressed} similar messages suppressed]"
+            record.args = None
+        return True
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def _stop_listener():
+    global _listener, _file_handler
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _file_handler is not None:
+        _file_handler.close()
+        _file_handler = None
+
+atexit.register(_stop_listener)
+
+def setup_logger(handler=None):
+    """Route SecurityMonitor records through a queue to the log file, or to
+    `handler` instead (web workers forward theirs to the hardware daemon)"""
+    global _listener, _queue_handler, _file_handler
     logger = logging.getLogger('SecurityMonitor')
 
     if logger.handlers:
         logger.handlers = []
+    _stop_listener()
 
     try:
         logger.setLevel(getattr(logging, Config.LOG_LEVEL.upper()))
-        
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        
-        file_handler = RotatingFileHandler(
-            Config.LOG_FILE, maxBytes=1024*1024, backupCount=5
-        )
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-        
+
+        if Config.LOG_FORMAT == 'json':
+            formatter = JsonLinesFormatter()
+        else:
+            formatter = logging.Formatter(
+                '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+            )
+
+        if handler is None:
+            # Rotated segments are gzipped and indexed in the background, see log_archive
+            handler = _file_handler = CompressingRotatingFileHandler(
+                Config.LOG_FILE, maxBytes=Config.LOG_MAX_BYTES,
+                archive_max_bytes=Config.LOG_ARCHIVE_MAX_BYTES
+            )
+        handler.setFormatter(formatter)
+
+        # Callers only enqueue; file I/O happens on the listener thread
+        log_queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+        _queue_handler = DroppingQueueHandler(log_queue)
+        _queue_handler.addFilter(RateLimitFilter(Config.LOG_RATE_LIMIT, Config.LOG_RATE_WINDOW))
+        _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+        _listener.start()
+        logger.addHandler(_queue_handler)
+
         return logger
     except AttributeError as e:
         print(f"Logger setup failed: Invalid log level '{Config.LOG_LEVEL}' - {e}")
@@ -29,3 +135,20 @@ def setup_logger():
     except Exception as e:
         print(f"Logger setup failed: {e}")
     return None
+
+def get_log_stats():
+    if _queue_handler is None:
+        return {}
+    rate_limit = _queue_handler.filters[0]
+    return {
+        'queued': _queue_handler.queue.qsize(),
+        'dropped': _queue_handler.dropped,
+        'suppressed': rate_limit.suppressed_total,
+    }
+
+def query_logs(start=None, end=None, level=None, limit=1000):
+    """Search the current log and its compressed archive; start/end are epoch seconds"""
+    min_level = logging.getLevelName(level.upper()) if level else logging.NOTSET
+    if not isinstance(min_level, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return search_logs(Config.LOG_FILE, start, end, min_level, limit)
@@ -0,0 +1,229 @@
+import itertools
+import math
+import threading
+from bisect import bisect_left
+from time import process_time
+
+STRIPES = 8
+
+# Latency buckets in seconds, from sub-millisecond GPIO work up to slow captures
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_stripe_ids = itertools.count()
+_local = threading.local()
+
+def _stripe():
+    # Each thread sticks to one stripe, so threads rarely contend on a lock
+    try:
+        return _local.stripe
+    except AttributeError:
+        _local.stripe = next(_stripe_ids) % STRIPES
+        return _local.stripe
+
+def _format_value(value):
+    # repr round-trips a float exactly; {:g} would cut counters to 6 digits
+    value = float(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in sorted(labels.items())) + '}'
+
+class _Metric(object):
+    type = None
+
+    def __init__(self, name, help, labels=None, width=1):
+        self.name = name
+        self.help = help
+        self.labels = dict(labels or {})
+        self._locks = [threading.Lock() for _ in range(STRIPES)]
+        self._cells = [[0.0] * width for _ in range(STRIPES)]
+
+    def _totals(self):
+        totals = [0.0] * len(self._cells[0])
+        for lock, cells in zip(self._locks, self._cells):
+            with lock:
+                for i, value in enumerate(cells):
+                    totals[i] += value
+        return totals
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1):
+        stripe = _stripe()
+        with self._locks[stripe]:
+            self._cells[stripe][0] += amount
+
+    def value(self):
+        return self._totals()[0]
+
+    def samples(self):
+        yield self.name, self.labels, self.value()
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1):
+        stripe = _stripe()
+        with self._locks[stripe]:
+            self._cells[stripe][0] += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        for lock, cells in zip(self._locks, self._cells):
+            with lock:
+                cells[0] = 0.0
+        self.inc(value)
+
+    def value(self):
+        return self._totals()[0]
+
+    def samples(self):
+        yield self.name, self.labels, self.value()
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=None, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # one cell per bucket, +Inf, then the sum
+        super().__init__(name, help, labels, width=len(self.buckets) + 2)
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        stripe = _stripe()
+        with self._locks[stripe]:
+            cells = self._cells[stripe]
+            cells[index] += 1
+            cells[-1] += value
+
+    def samples(self):
+        totals = self._totals()
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), totals[:-1]):
+            cumulative += count
+            yield f'{self.name}_bucket', dict(self.labels, le=bound), cumulative
+        yield f'{self.name}_count', self.labels, cumulative
+        yield f'{self.name}_sum', self.labels, totals[-1]
+
+class _Callback(object):
+    def __init__(self, name, help, type, func):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.func = func
+
+    def samples(self):
+        value = self.func()
+        if isinstance(value, dict):
+            for labels, sample in value.items():
+                yield self.name, dict(labels), sample
+        elif value is not None:
+            yield self.name, {}, value
+
+class Registry(object):
+    """Metrics are created once up front; recording only touches one stripe's lock"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.setdefault(metric.name, []).append(metric)
+        return metric
+
+    def counter(self, name, help, labels=None):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=None):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=None, buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, help, func, type='gauge'):
+        """Value computed at scrape time; func returns a number, None, or {labels tuple: value}.
+        Registering a name again replaces the earlier callback (e.g. a newly created app)."""
+        with self._lock:
+            self._metrics.pop(name, None)
+        return self._add(_Callback(name, help, type, func))
+
+    def collect(self, exclude=()):
+        """Families as [name, help, type, [[sample name, labels, value], ...]], in plain
+        lists and dicts so a snapshot can cross a process boundary as JSON"""
+        with self._lock:
+            groups = [(name, list(metrics)) for name, metrics in self._metrics.items()
+                      if name not in exclude]
+        families = []
+        for name, metrics in groups:
+            samples = []
+            for metric in metrics:
+                try:
+                    samples.extend([sample_name, dict(labels), value]
+                                   for sample_name, labels, value in metric.samples())
+                except Exception:
+                    continue  # a failing callback must not break the scrape
+            families.append([name, metrics[0].help, metrics[0].type, samples])
+        return families
+
+    def render(self):
+        """Prometheus text exposition format"""
+        return render_families(self.collect())
+
+def render_families(families):
+    lines = []
+    for name, help, type, samples in families:
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} {type}')
+        for sample_name, labels, value in samples:
+            lines.append(f'{sample_name}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+def merge_families(*sources):
+    """One family list from several snapshots; sources are (families, extra labels) pairs,
+    e.g. ({'worker': 'web-1'}) to tell processes apart"""
+    merged = {}
+    for families, extra in sources:
+        for name, help, type, samples in families:
+            family = merged.setdefault(name, [name, help, type, []])
+            family[3].extend([sample_name, dict(labels, **extra), value]
+                             for sample_name, labels, value in samples)
+    return list(merged.values())
+
+registry = Registry()
+
+SENSOR_EVENT_LATENCY = registry.histogram(
+    'security_sensor_event_latency_seconds', 'Time from sensor sample to status event published')
+CAPTURE_DURATION = registry.histogram(
+    'security_capture_duration_seconds', 'Time to capture an image to disk')
+CAPTURE_BYTES = registry.counter(
+    'security_capture_bytes_total', 'Bytes written by image captures')
+FRAMES_ENCODED = registry.counter(
+    'security_frames_encoded_total', 'JPEG frames produced by the camera encoder')
+STREAM_CLIENTS = {
+    stream: registry.gauge('security_stream_clients', 'Connected streaming clients', {'stream': stream})
+    for stream in ('mjpeg', 'sse')
+}
+STREAM_BYTES = {
+    stream: registry.counter('security_stream_bytes_sent_total', 'Bytes sent to streaming clients',
+                             {'stream': stream})
+    for stream in ('mjpeg', 'sse')
+}
+PASSWORD_HASHES = registry.counter(
+    'security_auth_password_hashes_total', 'Password hash verifications performed')
+LCD_RENDER_TIME = registry.histogram(
+    'security_lcd_render_seconds', 'Time spent writing a frame to the LCD')
+LOOP_JITTER = registry.histogram(
+    'security_loop_jitter_seconds', 'Monitor loop oversleep beyond the requested interval',
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5))
+
+registry.callback('process_cpu_seconds_total', 'CPU time used by this process', process_time, 'counter')
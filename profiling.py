@@ -0,0 +1,166 @@
+import inspect
+import os
+import sys
+import threading
+from collections import Counter
+from functools import wraps
+from time import perf_counter, sleep
+from metrics import registry
+
+PROFILE_MAX_SECONDS = 60
+
+
+class StageTimers(object):
+    """Opt-in timers around registered hot paths.
+
+    Stages are registered as (owner, attribute) pairs. While disabled the
+    owner holds the original function, so the hot path runs exactly as if no
+    timer existed; enable() swaps in timing wrappers and disable() puts the
+    originals back.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._stages = {}  # name -> (owner, attr, original)
+        self._stats = {}  # name -> [calls, total seconds, max seconds]
+        self._lock = threading.Lock()
+
+    def register(self, owner, attr, name=None):
+        name = name or f"{getattr(owner, '__name__', owner)}.{attr}"
+        with self._lock:
+            original = getattr(owner, attr)
+            self._stages[name] = (owner, attr, original)
+            self._stats.setdefault(name, [0, 0.0, 0.0])
+            if self.enabled:
+                setattr(owner, attr, self._wrap(name, original))
+        return name
+
+    def _record(self, name, elapsed):
+        with self._lock:
+            stats = self._stats[name]
+            stats[0] += 1
+            stats[1] += elapsed
+            if elapsed > stats[2]:
+                stats[2] = elapsed
+
+    def _wrap(self, name, func):
+        record = self._record
+        if inspect.isgeneratorfunction(func):
+            # For streaming generators the interesting time is how long the
+            # consumer takes with each item, i.e. from yield until resumed
+            @wraps(func)
+            def timed_generator(*args, **kwargs):
+                items = func(*args, **kwargs)
+                try:
+                    for item in items:
+                        started = perf_counter()
+                        yield item
+                        record(name, perf_counter() - started)
+                finally:
+                    items.close()
+            return timed_generator
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, perf_counter() - started)
+        return timed
+
+    def enable(self):
+        with self._lock:
+            if not self.enabled:
+                for name, (owner, attr, original) in self._stages.items():
+                    setattr(owner, attr, self._wrap(name, original))
+                self.enabled = True
+
+    def disable(self):
+        with self._lock:
+            if self.enabled:
+                for owner, attr, original in self._stages.values():
+                    setattr(owner, attr, original)
+                self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            for stats in self._stats.values():
+                stats[:] = [0, 0.0, 0.0]
+
+    def control(self, enabled=None, reset=False):
+        """Switch the timers on (True) or off (False), leave them as they are (None)"""
+        if enabled is True:
+            self.enable()
+        elif enabled is False:
+            self.disable()
+        if reset:
+            self.reset()
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    'calls': calls,
+                    'total': total,
+                    'avg': total / calls if calls else 0.0,
+                    'max': worst,
+                }
+                for name, (calls, total, worst) in self._stats.items()
+            }
+
+
+class SamplingProfiler(object):
+    """Samples every thread's stack at a fixed interval for a bounded time.
+
+    The result is in collapsed-stack form ("thread;outer;...;inner count"),
+    which flamegraph.pl and speedscope read directly.
+    """
+
+    def __init__(self):
+        self._running = threading.Lock()
+
+    @staticmethod
+    def _collapse(thread_name, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        names.append(thread_name)
+        return ';'.join(reversed(names))
+
+    def profile(self, seconds, interval=0.005):
+        """Sample for `seconds` and return a Counter of collapsed stacks"""
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            seconds = min(max(float(seconds), 0.0), PROFILE_MAX_SECONDS)
+            interval = max(float(interval), 0.001)
+            me = threading.get_ident()
+            stacks = Counter()
+            deadline = perf_counter() + seconds
+            while perf_counter() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident != me:
+                        stacks[self._collapse(names.get(ident, str(ident)), frame)] += 1
+                sleep(interval)
+            return stacks
+        finally:
+            self._running.release()
+
+    @staticmethod
+    def collapsed(stacks):
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+stage_timers = StageTimers()
+profiler = SamplingProfiler()
+
+registry.callback('security_stage_calls_total', 'Calls through enabled stage timers',
+                  lambda: {(('stage', name),): s['calls'] for name, s in stage_timers.stats().items()},
+                  'counter')
+registry.callback('security_stage_seconds_total', 'Time spent in timed stages',
+                  lambda: {(('stage', name),): s['total'] for name, s in stage_timers.stats().items()},
+                  'counter')
@@ -0,0 +1,85 @@
+import math
+import threading
+from collections import OrderedDict
+from time import time
+
+
+class SlidingWindowLimiter:
+    """Approximate sliding-window counter per key.
+
+    Each key keeps only the counts of the current and previous fixed windows;
+    the sliding count is the previous count weighted by how much of it still
+    overlaps the window, plus the current count. The table is an LRU bounded
+    to max_keys, so memory stays fixed no matter how many clients show up.
+    """
+
+    def __init__(self, limit, window, max_keys=4096):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._entries = OrderedDict()  # key -> [window index, previous count, current count]
+        self._lock = threading.Lock()
+        self.blocked_total = 0
+
+    def _entry(self, key, now, create=False):
+        index = int(now // self.window)
+        entry = self._entries.get(key)
+        if entry is None:
+            if not create:
+                return None
+            entry = self._entries[key] = [index, 0, 0]
+            if len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+        elif entry[0] != index:
+            entry[1] = entry[2] if entry[0] == index - 1 else 0
+            entry[2] = 0
+            entry[0] = index
+        self._entries.move_to_end(key)
+        return entry
+
+    def _estimate(self, entry, now):
+        overlap = 1.0 - (now % self.window) / self.window
+        return entry[1] * overlap + entry[2]
+
+    def retry_after(self, key, now=None):
+        """Seconds until key may try again, 0 if it is not limited"""
+        if now is None:
+            now = time()
+        with self._lock:
+            entry = self._entry(key, now)
+            if entry is None or self._estimate(entry, now) < self.limit:
+                return 0
+            self.blocked_total += 1
+            into_window = now % self.window
+            _, previous, current = entry
+            if current < self.limit:
+                # Wait for the previous window's weight to decay far enough
+                fraction = 1.0 - (self.limit - current) / previous
+                wait = self.window * fraction - into_window
+            else:
+                # This window alone is over the limit: wait for it to roll over and decay
+                fraction = 1.0 - self.limit / float(current)
+                wait = self.window - into_window + self.window * fraction
+            return max(1, int(math.ceil(wait)))
+
+    def hit(self, key, now=None):
+        if now is None:
+            now = time()
+        with self._lock:
+            self._entry(key, now, create=True)[2] += 1
+
+    def configure(self, limit, window):
+        """Apply new limits in place; counts from another window length are meaningless,
+        so a window change starts every key afresh"""
+        with self._lock:
+            if window != self.window:
+                self._entries.clear()
+            self.limit = limit
+            self.window = window
+
+    def reset(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
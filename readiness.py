@@ -0,0 +1,74 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+
+class Readiness(object):
+    """Startup futures for components that are brought up in parallel.
+
+    Each task runs on its own thread; its future completes when the task
+    returns. A task that raises, exits, or returns False counts as failed.
+    Callers block on wait(name) instead of polling for attributes.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger('SecurityMonitor')
+        self.components = {}  # name -> Future
+        self.timings = {}  # name -> seconds the task took
+        self.required = ()
+        self.started = monotonic()
+
+    def start(self, tasks, required=()):
+        """Run {name: func} concurrently; ready() only considers the required names"""
+        self.started = monotonic()
+        self.required = tuple(required)
+        pool = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix='HardwareInit')
+        for name, func in tasks.items():
+            self.components[name] = pool.submit(self._run, name, func)
+        pool.shutdown(wait=False)  # threads finish their task and exit
+        return self
+
+    def _run(self, name, func):
+        started = monotonic()
+        try:
+            if func() is False:
+                raise RuntimeError(f"{name} unavailable")
+            self.logger.info(f"{name} ready after {monotonic() - started:.2f}s")
+            return True
+        except SystemExit:
+            raise RuntimeError(f"{name} setup failed")
+        finally:
+            self.timings[name] = monotonic() - started
+
+    def wait(self, name, timeout=None):
+        """True once name is up; False if it failed, is unknown or timed out"""
+        future = self.components.get(name)
+        if future is None:
+            return False
+        try:
+            return future.result(timeout)
+        except Exception:
+            return False
+
+    def is_ready(self, name):
+        future = self.components.get(name)
+        return future is not None and future.done() and future.exception() is None
+
+    def ready(self):
+        return all(self.is_ready(name) for name in self.required)
+
+    def status(self):
+        status = {}
+        for name, future in self.components.items():
+            if not future.done():
+                state = 'starting'
+            elif future.exception() is None:
+                state = 'ready'
+            else:
+                state = 'failed'
+            status[name] = {
+                'state': state,
+                'required': name in self.required,
+                'seconds': self.timings.get(name, monotonic() - self.started),
+            }
+        return status
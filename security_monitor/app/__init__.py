@@ -1,3 +1,40 @@
+import queue
+from concurrent.futures import Future
 from flask import Flask
-from app.utils.config_manager import ConfigurationManager
-from app.core.security_monitor import SecurityMonitor
\ No newline at end of file
+import auth
+from broadcast import StatusBroadcaster
+from config_manager import ConfigurationManager
+from logger import setup_logger
+
+def create_app(config_file='security_config.yaml', status_queue=None):
+    """Build the web app. Nothing here touches the camera, GPIO or I2C, so web-only
+    tooling and tests start without the Pi libraries; init_monitor() adds the hardware."""
+    app = Flask(__name__)
+    setup_logger()
+
+    app.config_manager = ConfigurationManager(config_file)
+    auth.register_config_handlers(app.config_manager)
+    app.status_queue = status_queue if status_queue is not None else queue.Queue()
+    app.status_broadcaster = StatusBroadcaster(app.status_queue)  # one queue per /events client
+    app.security_monitor = None
+    app.monitor_ready = Future()  # resolves to the SecurityMonitor once it exists
+    app.daemon = None  # a web worker's DaemonClient when the hardware runs in another process
+
+    from .routes.main_routes import main_bp, register_metrics
+    from .routes.config_management import config_bp
+    app.register_blueprint(main_bp)
+    app.register_blueprint(config_bp)
+    register_metrics(app)
+
+    return app
+
+def init_monitor(app):
+    """Create the SecurityMonitor for app; hardware starts in the background"""
+    # Imported here: this pulls in RPi.GPIO, smbus and the LCD drivers
+    from .core.security_monitor import SecurityMonitor
+    monitor = SecurityMonitor(app.status_queue)
+    app.security_monitor = monitor
+    monitor.register_config_handlers(app.config_manager)
+    app.config_manager.start_watching()
+    app.monitor_ready.set_result(monitor)
+    return monitor
@@ -1,18 +1,24 @@
 from PCF8574 import PCF8574_GPIO
 from Adafruit_LCD1602 import Adafruit_CharLCD
 import RPi.GPIO as GPIO
-from time import sleep, time
+from time import sleep, time, perf_counter
 from datetime import datetime
 import sys
 import os
-from picamera2 import Picamera2
-from picamera2.encoders import JpegEncoder
-from picamera2.outputs import FileOutput
-from libcamera import controls
-from config import Config
+import queue
+from config import config_store
+from sensors import SensorRegistry
+from actuators import ActuatorScheduler
+from display import LCDRenderer
+from i2c_bus import I2CBus
+from url_signing import sign_capture_url
+from camera import CameraManager, StreamingOutput
 from logger import setup_logger
-import io
-import threading
+from profiling import stage_timers
+from heartbeats import Watchdog
+from readiness import Readiness
+from metrics import CAPTURE_BYTES, CAPTURE_DURATION, LOOP_JITTER, SENSOR_EVENT_LATENCY
+import logging
 
 class SecurityMonitor:
     def __init__(self, status_queue):
@@ -24,25 +30,34 @@ class SecurityMonitor:
 
         try:
             self.logger.info("Starting SecurityMonitor initialization")
-            self.DOOR_SENSOR_PIN = Config.DOOR_SENSOR_PIN
-            self.DOOR_LED_PIN = Config.DOOR_LED_PIN
-            self.BUZZER_PIN = Config.BUZZER_PIN
-            self.MOTION_SENSOR_PIN = Config.MOTION_SENSOR_PIN
-            self.MOTION_LED_PIN = Config.MOTION_LED_PIN
-            self.BUZZER_INTERVAL = Config.BUZZER_INTERVAL
-            self.CAPTURE_INTERVAL = Config.CAPTURE_INTERVAL
-            self.DISPLAY_UPDATE_INTERVAL = Config.DISPLAY_UPDATE_INTERVAL
+            self.config = config_store.current()
+            self.DOOR_SENSOR_PIN = self.config.DOOR_SENSOR_PIN
+            self.DOOR_LED_PIN = self.config.DOOR_LED_PIN
+            self.BUZZER_PIN = self.config.BUZZER_PIN
+            self.MOTION_SENSOR_PIN = self.config.MOTION_SENSOR_PIN
+            self.MOTION_LED_PIN = self.config.MOTION_LED_PIN
+            self.BUZZER_INTERVAL = self.config.BUZZER_INTERVAL
+            self.CAPTURE_INTERVAL = self.config.CAPTURE_INTERVAL
+            self.DISPLAY_UPDATE_INTERVAL = self.config.DISPLAY_UPDATE_INTERVAL
+            self.IMAGE_RESOLUTION = self.config.IMAGE_RESOLUTION
+            self.camera = None
+            self.sensors = SensorRegistry.from_config(self.config)
+            self.actuators = ActuatorScheduler(GPIO)
+            self.pending_reconfigure = queue.SimpleQueue()
             self.last_door_state = None
             self.last_motion_state = None
             self.last_buzzer_time = 0
             self.last_capture_time = 0
-            self.last_display_update = 0
+            self.last_display_lines = None
+            self.display = None
+            self.watchdog = Watchdog(self.config.WATCHDOG_TIMEOUT, self.on_stall,
+                                     self.config.WATCHDOG_SD_NOTIFY, self.logger)
             
-            os.makedirs(Config.IMAGE_DIR, exist_ok=True)
+            self.readiness = Readiness(self.logger)
             
-            self.setup_camera()
-            self.setup_gpio()
-            self.setup_lcd()
+            os.makedirs(self.config.IMAGE_DIR, exist_ok=True)
+            
+            self.start_hardware()
         except Exception as e:
             if self.logger:
                 self.logger.error(f"Initialization error: {str(e)}")
@@ -50,19 +65,24 @@ class SecurityMonitor:
                 print(f"Initialization error: {str(e)}")
             sys.exit(1)
 
+    def start_hardware(self):
+        """Bring up camera, GPIO and LCD concurrently; the camera alone takes seconds"""
+        self.readiness.start({
+            'gpio': self.setup_gpio,
+            'camera': self.setup_camera,
+            'lcd': self.setup_lcd,
+        }, required=('gpio', 'camera'))
+
     def setup_gpio(self):
         try:
             GPIO.setwarnings(False)
             GPIO.setmode(GPIO.BCM)
-            GPIO.setup(self.DOOR_SENSOR_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-            GPIO.setup(self.MOTION_SENSOR_PIN, GPIO.IN)
-            GPIO.setup(self.DOOR_LED_PIN, GPIO.OUT)
-            GPIO.setup(self.MOTION_LED_PIN, GPIO.OUT)
+            self.sensors.setup(GPIO)
             GPIO.setup(self.BUZZER_PIN, GPIO.OUT)
-            GPIO.output(self.DOOR_LED_PIN, GPIO.LOW)
-            GPIO.output(self.MOTION_LED_PIN, GPIO.LOW)
-            GPIO.output(self.BUZZER_PIN, GPIO.LOW)
-            self.logger.info("GPIO setup completed successfully")
+            self.actuators.reset()
+            for pin in self.sensors.led_pins + (self.BUZZER_PIN,):
+                self.actuators.write(pin, False, force=True)
+            self.logger.info(f"GPIO setup completed successfully ({len(self.sensors.sensors)} sensors)")
         except Exception as e:
             self.logger.error(f"GPIO Setup Error: {str(e)}")
             sys.exit(1)
@@ -71,33 +91,51 @@ class SecurityMonitor:
         try:
             PCF8574_address = 0x27
             PCF8574A_address = 0x3F
-            
-            try:
-                self.mcp = PCF8574_GPIO(PCF8574_address)
-            except:
-                try:
-                    self.mcp = PCF8574_GPIO(PCF8574A_address)
-                except:
-                    self.logger.error('I2C Address Error!')
-                    sys.exit(1)
-            
+
+            if self.display:
+                self.display.stop()
+                self.display = None
+
+            # Probe through the shared bus instead of opening a handle per guess
+            bus = I2CBus.get()
+            address = next((a for a in (PCF8574_address, PCF8574A_address) if bus.probe(a)), None)
+            if address is None:
+                self.logger.error('I2C Address Error! Continuing without LCD')
+                return False
+            self.mcp = PCF8574_GPIO(address)
+
             self.lcd = Adafruit_CharLCD(pin_rs=0, pin_e=2, pins_db=[4,5,6,7], GPIO=self.mcp)
             self.mcp.output(3, 1)
             self.lcd.begin(16, 2)
+            self.display = LCDRenderer(self.lcd, self.DISPLAY_UPDATE_INTERVAL, self.logger,
+                                        self.watchdog).start()
+            self.last_display_lines = None
             self.logger.info("LCD setup completed successfully")
+            return True
             
         except Exception as e:
-            self.logger.error(f"LCD Setup Error: {str(e)}")
-            sys.exit(1)
+            # A flaky I2C bus should not take security monitoring down with it
+            self.logger.error(f"LCD Setup Error: {str(e)} - continuing without LCD")
+            self.display = None
+            return False
 
     def setup_camera(self):
         try:
-            self.camera = Picamera2()
-            video_config = self.camera.create_video_configuration(main={"size": (640, 480)})
-            self.camera.configure(video_config)
-            self.output = StreamingOutput()
-            self.encoder = JpegEncoder()
-            self.camera.start_recording(self.encoder, FileOutput(self.output))
+            if self.camera is not None:
+                # Same camera object and output: viewers stay attached
+                self.camera.reconfigure(self.IMAGE_RESOLUTION, self.config.IMAGE_QUALITY,
+                                        self.config.CAMERA_FRAMERATE)
+                return
+            camera = CameraManager(logger=self.logger)
+            camera.start(self.IMAGE_RESOLUTION, self.config.IMAGE_QUALITY,
+                         self.config.CAMERA_FRAMERATE)
+            self.output = camera.output
+            # Published only once recording, so the config handler never sees a
+            # half-started camera; catch up on changes it skipped meanwhile
+            self.camera = camera
+            config = config_store.current()
+            self.IMAGE_RESOLUTION = tuple(config.IMAGE_RESOLUTION)
+            camera.reconfigure(self.IMAGE_RESOLUTION, config.IMAGE_QUALITY, config.CAMERA_FRAMERATE)
             self.logger.info("Camera initialized successfully with streaming")
         except Exception as e:
             if self.logger:
@@ -106,34 +144,99 @@ class SecurityMonitor:
                 print(f"Camera Setup Error: {str(e)}")
             sys.exit(1)
 
+    def register_config_handlers(self, config_manager):
+        """Reconfigure only the components a settings change actually touches"""
+        config_manager.register_handler(lambda key: key.endswith('_PIN') or key == 'SENSORS',
+                                        self.in_monitor_loop(self.on_gpio_config_change))
+        config_manager.register_handler(('IMAGE_RESOLUTION', 'IMAGE_QUALITY', 'CAMERA_FRAMERATE'),
+                                        self.in_monitor_loop(self.on_camera_config_change))
+        config_manager.register_handler(('LOG_LEVEL',), self.on_log_level_change)
+
+    def in_monitor_loop(self, handler):
+        """Queue a config handler for the monitor loop. Handlers are called on the
+        config manager's thread, while the sensor registry, the actuator
+        scheduler and GPIO are only safe to touch from the loop"""
+        return lambda changes: self.pending_reconfigure.put((handler, changes))
+
+    def apply_pending_reconfigure(self):
+        while not self.pending_reconfigure.empty():
+            handler, changes = self.pending_reconfigure.get()
+            try:
+                handler(changes)
+            except (Exception, SystemExit) as e:  # setup_gpio exits on failure
+                self.logger.error(f"Error applying configuration change {sorted(changes)}: {str(e)}")
+
+    def on_gpio_config_change(self, changes):
+        old_outputs = set(self.sensors.led_pins) | {self.BUZZER_PIN}
+        for key, (_, value) in changes.items():
+            if key.endswith('_PIN'):
+                setattr(self, key, value)
+        config = config_store.current()
+        if 'SENSORS' in changes or not config.SENSORS:
+            # An empty SENSORS setting is the door/motion pair on the *_PIN settings
+            self.sensors = SensorRegistry.from_config(config)
+        # Turn off LEDs/buzzer on pins no longer used before handing them back
+        released = old_outputs - set(self.sensors.led_pins) - {self.BUZZER_PIN}
+        for pin in released:
+            GPIO.output(pin, GPIO.LOW)
+        if released:
+            GPIO.cleanup(sorted(released))
+        self.setup_gpio()
+
+    def on_camera_config_change(self, changes):
+        if 'IMAGE_RESOLUTION' in changes:
+            self.IMAGE_RESOLUTION = tuple(changes['IMAGE_RESOLUTION'][1])
+        quality = changes['IMAGE_QUALITY'][1] if 'IMAGE_QUALITY' in changes else None
+        framerate = changes['CAMERA_FRAMERATE'][1] if 'CAMERA_FRAMERATE' in changes else None
+        if self.camera is None:
+            return  # still starting: setup_camera applies the latest settings once recording
+        self.camera.reconfigure(self.IMAGE_RESOLUTION, quality, framerate)
+
+    def refresh_config(self):
+        """Pick up the latest config snapshot; plain values are re-read here,
+        pins and the camera are reconfigured by the config manager handlers"""
+        self.config = config_store.current()
+        self.BUZZER_INTERVAL = self.config.BUZZER_INTERVAL
+        self.CAPTURE_INTERVAL = self.config.CAPTURE_INTERVAL
+        self.DISPLAY_UPDATE_INTERVAL = self.config.DISPLAY_UPDATE_INTERVAL
+        if self.display:
+            self.display.min_interval = self.DISPLAY_UPDATE_INTERVAL
+        self.watchdog.timeout = self.config.WATCHDOG_TIMEOUT
+
+    def on_log_level_change(self, changes):
+        self.logger.setLevel(getattr(logging, changes['LOG_LEVEL'][1].upper()))
+
     def update_display(self, force_update=False):
-        current_time = time()
-        if not force_update and (current_time - self.last_display_update) < self.DISPLAY_UPDATE_INTERVAL:
+        # Only posts to the render thread; the LCD bus is never touched here
+        if self.display is None:
             return
-
         try:
-            door_state, motion_state, _ = self.get_sensor_states()
-            
-            self.lcd.setCursor(0, 0)
-            door_status = "Door: OPEN   " if door_state else "Door: CLOSED "
-            self.lcd.message(door_status)
-            
-            self.lcd.setCursor(0, 1)
-            motion_status = "Motion: YES  " if motion_state else "Motion: NO   "
-            self.lcd.message(motion_status)
-            
-            self.last_display_update = current_time
-            
+            door_state = self.sensors.any_active('door')
+            motion_state = self.sensors.any_active('motion')
+
+            door_status = "Door: OPEN" if door_state else "Door: CLOSED"
+            motion_status = "Motion: YES" if motion_state else "Motion: NO"
+            lines = (door_status, motion_status)
+            if force_update or lines != self.last_display_lines:
+                self.display.post(lines)
+                self.last_display_lines = lines
+
         except Exception as e:
             self.logger.error(f"Display Update Error: {str(e)}")
 
     def capture_image(self, trigger_type):
+        if not self.readiness.is_ready('camera'):
+            self.logger.warning(f"Image capture skipped for {trigger_type} - camera not ready")
+            return None
         try:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             filename = f'{trigger_type}_{timestamp}.jpg'
-            filepath = os.path.join(Config.IMAGE_DIR, filename)
+            filepath = os.path.join(self.config.IMAGE_DIR, filename)
 
-            self.camera.capture_file(filepath)
+            started = perf_counter()
+            with self.watchdog.watch('capture'):
+                self.camera.capture_file(filepath)
+            CAPTURE_DURATION.observe(perf_counter() - started)
             self.logger.info(f"Image captured: {filepath}")  # Add this line
 
             # Verify file exists
@@ -141,6 +244,7 @@ class SecurityMonitor:
                 self.logger.error(f"Capture failed - file not created: {filepath}")
                 return None
 
+            CAPTURE_BYTES.inc(os.path.getsize(filepath))
             return filename
         except Exception as e:
             self.logger.error(f"Image Capture Error: {str(e)}")
@@ -149,54 +253,81 @@ class SecurityMonitor:
     def check_buzzer(self, is_door_open):
         current_time = time()
         if is_door_open and (current_time - self.last_buzzer_time) >= self.BUZZER_INTERVAL:
-            GPIO.output(self.BUZZER_PIN, GPIO.HIGH)
-            sleep(0.1)
-            GPIO.output(self.BUZZER_PIN, GPIO.LOW)
+            self.actuators.play(self.BUZZER_PIN, 'beep', now=current_time)
             self.last_buzzer_time = current_time
 
     def update_door_led(self, is_door_open):
-        GPIO.output(self.DOOR_LED_PIN, GPIO.HIGH if is_door_open else GPIO.LOW)
+        self.actuators.set(self.DOOR_LED_PIN, is_door_open)
 
     def update_motion_led(self, motion_detected):
-        GPIO.output(self.MOTION_LED_PIN, GPIO.HIGH if motion_detected else GPIO.LOW)
+        self.actuators.set(self.MOTION_LED_PIN, motion_detected)
+
+    def update_sensor_leds(self, changed):
+        for led_pin in {s.led_pin for s in changed if s.led_pin is not None}:
+            self.actuators.set(led_pin, self.sensors.active_by_led[led_pin] > 0)
 
     def get_sensor_states(self):
         try:
-            is_door_open = GPIO.input(self.DOOR_SENSOR_PIN) == GPIO.HIGH
-            motion_detected = GPIO.input(self.MOTION_SENSOR_PIN) == GPIO.HIGH
-            
-            state_changed = (is_door_open != self.last_door_state or 
-                           motion_detected != self.last_motion_state)
-                    
-            if state_changed:
+            sampled_at = perf_counter()
+            changed = self.sensors.sample(GPIO.input, GPIO.HIGH)
+            is_door_open = self.sensors.any_active('door')
+            motion_detected = self.sensors.any_active('motion')
+
+            for sensor in changed:
                 image_filename = None
-                if is_door_open and is_door_open != self.last_door_state:
-                    image_filename = self.capture_image('door')
-                elif motion_detected and motion_detected != self.last_motion_state:
-                    image_filename = self.capture_image('motion')
+                if sensor.state:
+                    image_filename = self.capture_image(sensor.type)
 
                 status_data = {
+                    'zone': sensor.zone,
+                    'sensor': sensor.type,
+                    'active': sensor.state,
                     'door': 'OPEN' if is_door_open else 'CLOSED',
                     'motion': 'DETECTED' if motion_detected else 'NONE',
                     'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'image': image_filename
+                    'image': image_filename,
+                    'image_url': sign_capture_url(image_filename) if image_filename else None
                 }
 
                 self.status_queue.put(status_data)
-            
+                SENSOR_EVENT_LATENCY.observe(perf_counter() - sampled_at)
+
+            if changed:
+                self.update_sensor_leds(changed)
+
             self.last_door_state = is_door_open
             self.last_motion_state = motion_detected
-            
-            return is_door_open, motion_detected, state_changed
+
+            return is_door_open, motion_detected, bool(changed)
         except Exception as e:
             self.logger.error(f"Error reading sensors: {str(e)}")
             return False, False, False
 
+    def get_display_stats(self):
+        return self.display.stats() if self.display else {}
+
+    def get_bus_stats(self):
+        return {busnum: bus.stats() for busnum, bus in I2CBus.opened().items()}
+
+    def get_watchdog_stats(self):
+        return self.watchdog.stats()
+
+    def on_stall(self, event):
+        """Tell dashboard clients a component stopped reporting"""
+        self.status_queue.put({
+            'alert': 'stall',
+            'component': event['component'],
+            'stalled_for': round(event['stalled_for'], 1),
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        })
+
     def cleanup(self):
         try:
-            self.lcd.clear()
-            self.camera.stop_recording()
-            self.camera.close()
+            self.watchdog.stop()
+            if self.display and self.display.stop():
+                self.lcd.clear()
+            if self.camera:
+                self.camera.close()
             GPIO.cleanup()
             self.logger.info("Cleaning up resources...")
         except Exception as e:
@@ -204,24 +335,37 @@ class SecurityMonitor:
 
     def run(self):
         self.logger.info('Security monitoring system starting...')
+        # Sensors only need GPIO; the camera and LCD keep starting in the background
+        if not self.readiness.wait('gpio', self.config.HARDWARE_READY_TIMEOUT):
+            self.logger.error("GPIO not available - cannot monitor sensors")
+            self.cleanup()
+            sys.exit(1)
         try:
+            self.get_sensor_states()
             self.update_display(force_update=True)
+            self.watchdog.register('monitor')
+            self.watchdog.start()
             while True:
+                self.watchdog.heartbeat('monitor')
+                if config_store.version != self.config.version:
+                    self.refresh_config()
+                self.apply_pending_reconfigure()
+                self.get_sensor_states()
+                self.check_buzzer(self.sensors.buzzer_active > 0)
+                self.actuators.tick()
                 self.update_display()
-                sleep(0.1)
+                next_step = self.actuators.time_to_next()
+                interval = 0.1 if next_step is None else min(0.1, next_step)
+                slept_at = perf_counter()
+                sleep(interval)
+                LOOP_JITTER.observe(max(0.0, perf_counter() - slept_at - interval))
         except KeyboardInterrupt:
             self.cleanup()
         except Exception as e:
             self.logger.error(f"Runtime error: {str(e)}")
             self.cleanup()
 
-class StreamingOutput(io.BufferedIOBase):
-    def __init__(self):
-        self.frame = None
-        self.condition = threading.Condition()
-
-    def write(self, buf):
-        with self.condition:
-            self.frame = buf
-            self.condition.notify_all()
-        return len(buf)
\ No newline at end of file
+# Timed only while stage timers are switched on from /admin/stages
+stage_timers.register(SecurityMonitor, 'capture_image', 'capture_image')
+stage_timers.register(Adafruit_CharLCD, 'write4bits', 'lcd.write4bits')
+stage_timers.register(Adafruit_CharLCD, 'writeData', 'lcd.writeData')
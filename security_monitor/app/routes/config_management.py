@@ -1,7 +1,8 @@
 # routes/config_management.py
-from flask import Blueprint, render_template, request, jsonify, flash
+from flask import Blueprint, render_template, request, jsonify, flash, current_app
+from dataclasses import asdict
 from functools import wraps
-from auth import requires_auth
+from auth import requires_auth, current_user
 
 config_bp = Blueprint('config', __name__)
 
@@ -9,7 +10,7 @@ def validate_config_access(f):
     """Decorator to validate configuration access"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if request.authorization.username != 'admin':
+        if current_user() != 'admin':
             return jsonify({
                 'success': False,
                 'message': 'Only admin users can modify configuration'
@@ -37,6 +38,7 @@ def settings():
         'Image Configuration': {
             'IMAGE_RESOLUTION': config.IMAGE_RESOLUTION,
             'IMAGE_QUALITY': config.IMAGE_QUALITY,
+            'CAMERA_FRAMERATE': config.CAMERA_FRAMERATE,
             'MOTION_DETECTION_SENSITIVITY': config.MOTION_DETECTION_SENSITIVITY
         },
         'Notification Configuration': {k: v for k, v in asdict(config).items() 
@@ -56,14 +58,8 @@ def update_settings():
     """Update configuration settings"""
     try:
         updates = request.get_json()
+        # Affected components are reconfigured by the config manager's change handlers
         success, message = current_app.config_manager.update_config(updates)
-        
-        if success:
-            # Reload necessary components
-            if any(k.endswith('_PIN') for k in updates.keys()):
-                current_app.security_monitor.setup_gpio()
-            if 'IMAGE_RESOLUTION' in updates:
-                current_app.security_monitor.setup_camera()
                 
         return jsonify({
             'success': success,
@@ -88,12 +84,8 @@ def restore_backup():
                 'message': 'No backup file specified'
             }), 400
             
+        # Only settings that differ from the running config trigger a reconfiguration
         success, message = current_app.config_manager.restore_backup(backup_file)
-        if success:
-            # Reload all components
-            current_app.security_monitor.setup_gpio()
-            current_app.security_monitor.setup_camera()
-            current_app.security_monitor.setup_lcd()
             
         return jsonify({
             'success': success,
@@ -0,0 +1,270 @@
+# routes/main_routes.py
+import json
+import logging
+import queue
+import sys
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime
+from time import monotonic
+from flask import (Blueprint, Response, current_app, jsonify, redirect, render_template, request,
+                   send_from_directory, url_for)
+from auth import (requires_auth, requires_admin, requires_auth_or_signature, authenticate, attempt_login, set_session_cookie, clear_session_cookie,
+                  throttled, current_user)
+from config import Config, config_store
+from logger import get_log_stats, query_logs
+from metrics import STREAM_BYTES, STREAM_CLIENTS, registry, render_families
+from profiling import stage_timers, profiler
+from heartbeats import register_watchdog_metrics
+
+main_bp = Blueprint('main', __name__)
+logger = logging.getLogger('SecurityMonitor')
+
+SSE_KEEPALIVE_INTERVAL = 15  # seconds between comment lines on an idle /events stream
+
+@main_bp.route('/')
+@requires_auth
+def index():
+    return render_template('index.html')
+
+@main_bp.route('/login', methods=['GET', 'POST'])
+def login():
+    """Exchange credentials for a signed session cookie"""
+    if request.method == 'GET':
+        # Browser flow: the Basic auth prompt runs once, then the cookie takes over
+        auth = request.authorization
+        if not auth:
+            return authenticate()
+        valid, retry_after = attempt_login(auth.username, auth.password)
+        if retry_after:
+            return throttled(retry_after)
+        if not valid:
+            return authenticate()
+        return set_session_cookie(redirect(url_for('main.index')), auth.username)
+    data = request.get_json(silent=True) or request.form
+    username = data.get('username', '')
+    valid, retry_after = attempt_login(username, data.get('password', ''))
+    if retry_after:
+        return throttled(retry_after)
+    if not valid:
+        return jsonify({'success': False, 'message': 'Invalid credentials'}), 401
+    return set_session_cookie(jsonify({'success': True}), username)
+
+@main_bp.route('/logout', methods=['POST'])
+def logout():
+    return clear_session_cookie(jsonify({'success': True}))
+
+@main_bp.route('/events')
+@requires_auth
+def events():
+    broadcaster = current_app.status_broadcaster
+    events = broadcaster.subscribe()  # before the response starts: no event is missed
+
+    def generate():
+        STREAM_CLIENTS['sse'].inc()
+        try:
+            while True:
+                try:
+                    status_data = events.get(timeout=SSE_KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    # A comment line: a gone client fails this write and frees its stream slot
+                    message = ": keepalive\n\n"
+                else:
+                    try:
+                        logger.info("Sending status data: %s", status_data)
+                        message = f"data: {json.dumps(status_data)}\n\n"
+                    except Exception as e:
+                        logger.error(f"Stream error: {str(e)}")
+                        continue
+                STREAM_BYTES['sse'].inc(len(message))
+                yield message
+        finally:
+            broadcaster.unsubscribe(events)
+            STREAM_CLIENTS['sse'].dec()
+    return Response(generate(), mimetype='text/event-stream')
+
+@main_bp.route('/static/captures/<path:filename>')
+@requires_auth_or_signature
+def serve_image(filename):
+    # Absolute (see config.ABSOLUTE_PATHS): Flask would resolve a relative
+    # directory against the package, not where capture_image writes
+    return send_from_directory(config_store.current().IMAGE_DIR, filename)
+
+def wait_for_component(name, timeout=None):
+    """The monitor once component `name` is up, None if it is not up within timeout"""
+    if timeout is None:
+        timeout = Config.HARDWARE_READY_TIMEOUT
+    deadline = monotonic() + timeout
+    try:
+        monitor = current_app.monitor_ready.result(timeout)
+    except FutureTimeout:  # not the builtin TimeoutError before Python 3.11
+        return None
+    return monitor if monitor.readiness.wait(name, max(0.0, deadline - monotonic())) else None
+
+@main_bp.route('/video_feed')
+@requires_auth
+def video_feed():
+    monitor = wait_for_component('camera')
+    if monitor is None:
+        return Response('Camera is not available yet\n', 503, {'Retry-After': '5'})
+    return Response(generate_frames(monitor),
+                   mimetype='multipart/x-mixed-replace; boundary=frame')
+
+def generate_frames(monitor):
+    # Viewers are non-critical: a stalled stream shows as degraded but never
+    # fails /healthz or stops the systemd watchdog. The beat covers waiting for
+    # a frame; time blocked sending to a slow client is that client's problem.
+    STREAM_CLIENTS['mjpeg'].inc()
+    stream = f"mjpeg-{threading.get_ident()}"
+    monitor.watchdog.register(stream, critical=False)
+    try:
+        while True:
+            monitor.watchdog.heartbeat(stream)
+            with monitor.output.condition:
+                monitor.output.condition.wait()
+                frame = monitor.output.frame
+            chunk = (b'--frame\r\n'
+                     b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+            STREAM_BYTES['mjpeg'].inc(len(chunk))
+            yield chunk
+    except Exception as e:
+        logger.error(f"Streaming Error: {str(e)}")
+    finally:
+        monitor.watchdog.unregister(stream)
+        STREAM_CLIENTS['mjpeg'].dec()
+
+stage_timers.register(sys.modules[__name__], 'generate_frames', 'mjpeg.send')
+
+@main_bp.route('/healthz')
+def healthz():
+    """Liveness: serving requests and no critical thread (monitor loop, capture) is stalled;
+    stalled optional components such as the LCD or a stream only report degraded"""
+    monitor = current_app.security_monitor
+    stats = monitor.get_watchdog_stats() if monitor else {}
+    stalled = sorted(name for name, s in stats.items() if s['stalled'] and s.get('critical', True))
+    degraded = sorted(name for name, s in stats.items() if s['stalled'] and not s.get('critical', True))
+    status = 'stalled' if stalled else 'degraded' if degraded else 'ok'
+    return jsonify({'status': status, 'stalled': stalled, 'degraded': degraded}), 503 if stalled else 200
+
+@main_bp.route('/readyz')
+def readyz():
+    """Readiness of each hardware component; 503 until the required ones are up"""
+    monitor = current_app.security_monitor
+    if monitor is None:
+        return jsonify({'ready': False, 'components': {}}), 503
+    ready = monitor.readiness.ready()
+    return jsonify({'ready': ready, 'components': monitor.readiness.status()}), 200 if ready else 503
+
+def _parse_time(value):
+    """Epoch seconds from an ISO 8601 time or a plain number"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@main_bp.route('/api/logs')
+@requires_auth
+def api_logs():
+    """Log records between ?from= and ?to= at ?level= or above, oldest first"""
+    try:
+        start = _parse_time(request.args.get('from'))
+        end = _parse_time(request.args.get('to'))
+        limit = max(1, min(request.args.get('limit', 1000, type=int), 10000))
+        records = query_logs(start, end, request.args.get('level'), limit)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'count': len(records), 'records': records})
+
+@main_bp.route('/metrics')
+@requires_auth
+def metrics():
+    daemon = current_app.daemon
+    if daemon is not None:
+        try:
+            return Response(render_families(daemon.metrics()), mimetype='text/plain; version=0.0.4')
+        except Exception as e:
+            logger.error(f"Daemon metrics Error: {str(e)} - serving this worker's only")
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@main_bp.route('/admin/stages', methods=['GET', 'POST'])
+@requires_admin
+def stage_timing():
+    """Show stage timings; POST enabled=true/false to switch the timers"""
+    enabled, reset = None, False
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or request.form
+        if 'enabled' in data:
+            enabled = str(data['enabled']).lower() in ('1', 'true', 'on', 'yes')
+        reset = bool(data.get('reset'))
+    daemon = current_app.daemon
+    if daemon is not None:
+        # The hardware stages (captures, LCD writes) run in the daemon
+        try:
+            enabled_now, stages = daemon.stages(enabled, reset)
+        except Exception as e:
+            return jsonify({'success': False, 'message': f"Hardware daemon: {str(e)}"}), 504
+    else:
+        stage_timers.control(enabled, reset)
+        enabled_now, stages = stage_timers.enabled, stage_timers.stats()
+    if request.method == 'POST':
+        logger.info(f"Stage timers {'enabled' if enabled_now else 'disabled'} by {current_user()}")
+    return jsonify({'enabled': enabled_now, 'stages': stages})
+
+@main_bp.route('/admin/profile', methods=['POST'])
+@requires_admin
+def sample_profile():
+    """Sample all thread stacks for ?seconds=N and return collapsed stacks"""
+    seconds = request.args.get('seconds', 10, type=float)
+    interval = request.args.get('interval', 0.005, type=float)
+    daemon = current_app.daemon
+    try:
+        # With web workers the daemon is sampled too; stacks then start with the process
+        stacks = daemon.profile(seconds, interval) if daemon else profiler.profile(seconds, interval)
+    except RuntimeError as e:
+        return jsonify({'success': False, 'message': str(e)}), 409
+    except FutureTimeout:
+        return jsonify({'success': False, 'message': 'Hardware daemon did not answer'}), 504
+    return Response(profiler.collapsed(stacks), mimetype='text/plain')
+
+def register_metrics(app):
+    """Export the app's hardware counters; they are read at scrape time, so the
+    hot paths pay nothing for them. Their names go in app.hardware_metrics:
+    web workers leave those to the hardware daemon's own snapshot."""
+    app.hardware_metrics = set()
+
+    def from_monitor(read):
+        def value():
+            monitor = app.security_monitor
+            return read(monitor) if monitor else None
+        return value
+
+    def hardware(name, help, read, type='gauge'):
+        app.hardware_metrics.add(name)
+        registry.callback(name, help, from_monitor(read), type)
+
+    def per_bus(key):
+        return lambda monitor: {(('bus', num),): s[key] for num, s in monitor.get_bus_stats().items()}
+
+    hardware('security_lcd_frames_rendered_total', 'Frames written to the LCD',
+             lambda m: m.get_display_stats().get('rendered'), 'counter')
+    hardware('security_lcd_frames_dropped_total', 'LCD frames superseded before rendering',
+             lambda m: m.get_display_stats().get('dropped'), 'counter')
+    hardware('security_i2c_transactions_total', 'I2C transactions per bus',
+             per_bus('transactions'), 'counter')
+    hardware('security_i2c_errors_total', 'Failed I2C transactions per bus',
+             per_bus('errors'), 'counter')
+    hardware('security_camera_switches_total', 'Camera reconfigurations',
+             lambda m: m.camera.switches if m.camera else None, 'counter')
+    hardware('security_component_ready', 'Hardware components that finished starting',
+             lambda m: {(('component', name),): float(s['state'] == 'ready')
+                        for name, s in m.readiness.status().items()})
+    # This process's own watchdog: a web worker's streams, or everything in the daemon
+    register_watchdog_metrics(lambda: app.security_monitor.watchdog.stats() if app.security_monitor else None)
+    registry.callback('security_sse_events_dropped_total', 'Events dropped for /events clients that fell behind',
+                      lambda: app.status_broadcaster.dropped, 'counter')
+    registry.callback('security_log_records_dropped_total', 'Log records dropped on a full queue',
+                      lambda: get_log_stats().get('dropped'), 'counter')
+    registry.callback('security_log_records_suppressed_total', 'Log records suppressed by rate limiting',
+                      lambda: get_log_stats().get('suppressed'), 'counter')
@@ -1,4 +0,0 @@
-from app.utils.config_manager import ConfigurationManager
-
-# Create a singleton instance of ConfigurationManager
-config_manager = ConfigurationManager()
\ No newline at end of file
@@ -4,17 +4,19 @@
 # Author      : freenove
 # modification: 2018/08/03
 ########################################################################
-import smbus
+from i2c_bus import I2CBus
 import time
+
 class PCF8574_I2C(object):
     OUPUT = 0
     INPUT = 1
     
-    def __init__(self,address):
+    def __init__(self,address,busnum=1):
         # Note you need to change the bus number to 0 if running on a revision 1 Raspberry Pi.
-        self.bus = smbus.SMBus(1)
+        self.bus = I2CBus.get(busnum)   # shared with every other device on the bus
         self.address = address
         self.currentValue = 0
+        self.lcd = None
         self.writeByte(0)   #I2C test.
         
     def readByte(self):#Read PCF8574 all port of the data
@@ -25,6 +27,50 @@ class PCF8574_I2C(object):
         self.currentValue = value
         self.bus.write_byte(self.address,value)
 
+    def writeBlock(self,values,retry=True):#Write a sequence of port values in as few transactions as possible
+        if not values:
+            return
+        self.bus.write_block(self.address,values,retry)
+        self.currentValue = values[-1]
+
+    def setupLCD(self,pin_rs,pin_e,pins_db):#Precompute HD44780 4-bit port bytes for the given wiring
+        nibbles = []
+        for nibble in range(16):
+            value = 0
+            for bit, pin in enumerate(pins_db):
+                if nibble & (1 << bit):
+                    value |= 1 << pin
+            nibbles.append(value)
+        mask = (1 << pin_rs) | (1 << pin_e)
+        for pin in pins_db:
+            mask |= 1 << pin
+        self.lcd = {'rs': 1 << pin_rs, 'e': 1 << pin_e, 'mask': mask,
+                    'nibbles': nibbles, 'frames': None, 'extra': None}
+
+    def lcdFrames(self,char_mode):#Per-byte data/EN-high/EN-low sequences, rebuilt when non-LCD bits change
+        lcd = self.lcd
+        extra = self.currentValue & ~lcd['mask'] & 0xFF
+        if lcd['extra'] != extra:
+            frames = ([], [])
+            for rs, table in ((0, frames[0]), (lcd['rs'], frames[1])):
+                for value in range(256):
+                    seq = bytearray()
+                    for nibble in (value >> 4, value & 0x0F):
+                        port = extra | rs | lcd['nibbles'][nibble]
+                        seq += bytes((port, port | lcd['e'], port))
+                    table.append(bytes(seq))
+            lcd['frames'] = frames
+            lcd['extra'] = extra
+        return lcd['frames'][1 if char_mode else 0]
+
+    def writeLCD(self,data,char_mode=False):#Send bytes to an HD44780 in one bus transaction
+        frames = self.lcdFrames(char_mode)
+        # Not retried: replaying a partly latched stream garbles the display; the LCD resyncs instead
+        self.writeBlock(b''.join(frames[value] for value in data),retry=False)
+
+    def batch(self):#Coalesce every write made inside the block into one bus transaction
+        return self.bus.batch()
+
     def digitalRead(self,pin):#Read PCF8574 one port of the data
         value = readByte()  
         return (value&(1<<pin)==(1<<pin)) and 1 or 0
@@ -65,9 +111,15 @@ class PCF8574_GPIO(object):#Standardization function interface
         return self.chip.digitalRead(pin)
     def output(self,pin,value):#Write data to PCF8574 one port
         self.chip.digitalWrite(pin,value)
+    def setupLCD(self,pin_rs,pin_e,pins_db):
+        self.chip.setupLCD(pin_rs,pin_e,pins_db)
+    def writeLCD(self,data,char_mode=False):
+        self.chip.writeLCD(data,char_mode)
+    def batchLCD(self):
+        return self.chip.batch()
         
 def destroy():
-    bus.close()
+    I2CBus.get().bus.close()
     
 if __name__ == '__main__':
     print ('Program is starting ... ')
@@ -0,0 +1,145 @@
+from time import time
+
+SENSOR_TYPES = ('door', 'motion')
+
+# Per-type defaults applied when a sensor definition leaves a field out
+SENSOR_DEFAULTS = {
+    'door': {'debounce': 0.05, 'pull_up': True, 'buzzer': True},
+    'motion': {'debounce': 0.0, 'pull_up': False, 'buzzer': False},
+}
+
+
+class Sensor(object):
+    __slots__ = ('zone', 'type', 'pin', 'debounce', 'led_pin', 'buzzer',
+                 'pull_up', 'active_high', 'state', 'raw', 'raw_since')
+
+    def __init__(self, zone, type, pin, debounce=None, led_pin=None,
+                 buzzer=None, pull_up=None, active_high=True):
+        if type not in SENSOR_TYPES:
+            raise ValueError(f"Unknown sensor type for {zone}: {type}")
+        if not 0 <= int(pin) <= 27:
+            raise ValueError(f"Invalid pin for {zone}: {pin}")
+        if led_pin is not None and not 0 <= int(led_pin) <= 27:
+            raise ValueError(f"Invalid LED pin for {zone}: {led_pin}")
+        defaults = SENSOR_DEFAULTS[type]
+        self.zone = str(zone)
+        self.type = type
+        self.pin = int(pin)
+        self.debounce = float(defaults['debounce'] if debounce is None else debounce)
+        if self.debounce < 0:
+            raise ValueError(f"Invalid debounce for {zone}: {debounce}")
+        self.led_pin = None if led_pin is None else int(led_pin)
+        self.buzzer = bool(defaults['buzzer'] if buzzer is None else buzzer)
+        self.pull_up = bool(defaults['pull_up'] if pull_up is None else pull_up)
+        self.active_high = bool(active_high)
+        self.state = None
+        self.raw = None
+        self.raw_since = 0.0
+
+    def to_dict(self):
+        return {
+            'zone': self.zone,
+            'type': self.type,
+            'pin': self.pin,
+            'debounce': self.debounce,
+            'led_pin': self.led_pin,
+            'buzzer': self.buzzer,
+            'pull_up': self.pull_up,
+            'active_high': self.active_high,
+        }
+
+
+def default_sensor_defs(config):
+    """Build the legacy single door/motion registry from the *_PIN settings"""
+    return [
+        {'zone': 'door', 'type': 'door', 'pin': config.DOOR_SENSOR_PIN,
+         'led_pin': config.DOOR_LED_PIN},
+        {'zone': 'motion', 'type': 'motion', 'pin': config.MOTION_SENSOR_PIN,
+         'led_pin': config.MOTION_LED_PIN},
+    ]
+
+
+class SensorRegistry(object):
+    """Set of configured sensors sampled together in one pass.
+
+    Aggregate counts (open doors, active motion zones, lit LEDs, buzzer
+    demand) are maintained incrementally on state changes, so consumers such
+    as the LCD and the event stream never have to walk the sensor list.
+    """
+
+    def __init__(self, sensor_defs):
+        sensors = []
+        zones = set()
+        pins = set()
+        for definition in sensor_defs:
+            sensor = Sensor(**definition)
+            if sensor.zone in zones:
+                raise ValueError(f"Duplicate sensor zone: {sensor.zone}")
+            if sensor.pin in pins:
+                raise ValueError(f"Duplicate sensor pin: {sensor.pin}")
+            zones.add(sensor.zone)
+            pins.add(sensor.pin)
+            sensors.append(sensor)
+
+        self.sensors = tuple(sensors)
+        self.sensor_by_zone = {s.zone: s for s in self.sensors}
+        self.led_pins = tuple(sorted({s.led_pin for s in self.sensors
+                                      if s.led_pin is not None}))
+        overlap = pins.intersection(self.led_pins)
+        if overlap:
+            raise ValueError(f"Pins used as both sensor and LED: {sorted(overlap)}")
+
+        self.active_by_type = {t: 0 for t in SENSOR_TYPES}
+        self.active_by_led = {pin: 0 for pin in self.led_pins}
+        self.buzzer_active = 0
+
+    @classmethod
+    def from_config(cls, config):
+        sensor_defs = getattr(config, 'SENSORS', None) or default_sensor_defs(config)
+        return cls(sensor_defs)
+
+    def setup(self, GPIO):
+        for sensor in self.sensors:
+            if sensor.pull_up:
+                GPIO.setup(sensor.pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            else:
+                GPIO.setup(sensor.pin, GPIO.IN)
+        for pin in self.led_pins:
+            GPIO.setup(pin, GPIO.OUT)
+
+    def sample(self, read, high, now=None):
+        """Read every sensor pin once and return the sensors whose debounced state changed"""
+        if now is None:
+            now = time()
+        changed = []
+        for sensor in self.sensors:
+            raw = (read(sensor.pin) == high) == sensor.active_high
+            if raw != sensor.raw:
+                sensor.raw = raw
+                sensor.raw_since = now
+            if raw != sensor.state and (sensor.state is None or
+                                        now - sensor.raw_since >= sensor.debounce):
+                self._apply(sensor, raw)
+                changed.append(sensor)
+        return changed
+
+    def _apply(self, sensor, active):
+        was_active = bool(sensor.state)
+        sensor.state = active
+        if active == was_active:
+            return
+        delta = 1 if active else -1
+        self.active_by_type[sensor.type] += delta
+        if sensor.led_pin is not None:
+            self.active_by_led[sensor.led_pin] += delta
+        if sensor.buzzer:
+            self.buzzer_active += delta
+
+    def any_active(self, sensor_type):
+        return self.active_by_type[sensor_type] > 0
+
+    def led_states(self):
+        return {pin: count > 0 for pin, count in self.active_by_led.items()}
+
+    def to_dicts(self):
+        return [s.to_dict() for s in self.sensors]
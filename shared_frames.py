@@ -0,0 +1,129 @@
+import struct
+import threading
+from multiprocessing import shared_memory
+from time import sleep
+
+_MAGIC = b'SMFR'
+# magic, version, slots, slot size, frames published
+_HEADER = struct.Struct('<4sIIIQ')
+# sequence (odd while the slot is being written), frame number, length
+_SLOT = struct.Struct('<QQI')
+_ALIGN = 64
+
+
+def _padded(size):
+    return (size + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class FrameRing(object):
+    """Latest JPEG frames in shared memory, one writer and any number of readers.
+
+    Each slot carries a seqlock: the writer makes the sequence odd, copies
+    the frame, then makes it even again, and only then bumps the published
+    counter in the header. A reader that sees the same even sequence before
+    and after its copy has a whole frame. Python cannot issue memory
+    barriers, so the ring is several slots deep: the writer is always a few
+    frames away from the slot being read, and a lap is caught by the check.
+    """
+
+    def __init__(self, slots=4, slot_size=512 * 1024, name=None, create=True):
+        header, slot_header = _padded(_HEADER.size), _padded(_SLOT.size)
+        if create:
+            size = header + slots * (slot_header + slot_size)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            _HEADER.pack_into(self.shm.buf, 0, _MAGIC, 1, slots, slot_size, 0)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            magic, _, slots, slot_size, _ = _HEADER.unpack_from(self.shm.buf, 0)
+            if magic != _MAGIC:
+                raise ValueError(f"{name} is not a frame ring")
+        self.buf = self.shm.buf
+        self.slots = slots
+        self.slot_size = slot_size
+        self.offsets = [header + i * (slot_header + slot_size) for i in range(slots)]
+        self.data_offset = slot_header
+        self.oversized = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def published(self):
+        return _HEADER.unpack_from(self.buf, 0)[4]
+
+    def write(self, frame):
+        """Publish frame (bytes-like); frames larger than a slot are dropped"""
+        length = len(frame)
+        if length > self.slot_size:
+            self.oversized += 1
+            return
+        number = self.published() + 1
+        offset = self.offsets[number % self.slots]
+        sequence = _SLOT.unpack_from(self.buf, offset)[0]
+        _SLOT.pack_into(self.buf, offset, sequence + 1, number, length)
+        start = offset + self.data_offset
+        self.buf[start:start + length] = frame
+        _SLOT.pack_into(self.buf, offset, sequence + 2, number, length)
+        struct.pack_into('<Q', self.buf, _HEADER.size - 8, number)
+
+    def read(self, after=0, retries=5):
+        """(frame number, bytes) of the newest frame past `after`, None if there is none"""
+        for _ in range(retries):
+            number = self.published()
+            if number <= after:
+                return None
+            offset = self.offsets[number % self.slots]
+            sequence, slot_number, length = _SLOT.unpack_from(self.buf, offset)
+            if sequence & 1 or length > self.slot_size:
+                sleep(0)
+                continue
+            start = offset + self.data_offset
+            frame = bytes(self.buf[start:start + length])
+            if _SLOT.unpack_from(self.buf, offset)[0] == sequence and slot_number > after:
+                return slot_number, frame
+        return None
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class SharedFrameOutput(object):
+    """Reader side of a FrameRing with the StreamingOutput interface.
+
+    One thread per process watches the published counter and wakes viewers
+    through `condition`; `frame` copies a frame out of shared memory once per
+    frame number however many viewers ask for it, and not at all without them.
+    """
+
+    def __init__(self, ring, poll_interval=0.01):
+        self.ring = ring
+        self.poll_interval = poll_interval
+        self.condition = threading.Condition()
+        self.copies = 0
+        self._cached = (0, None)
+        self._seen = ring.published()
+        self.thread = threading.Thread(target=self._watch, name='FrameWatch', daemon=True)
+        self.thread.start()
+
+    @property
+    def frame(self):
+        number, frame = self._cached
+        latest = self.ring.read(number)
+        if latest is not None:
+            self._cached = latest
+            self.copies += 1
+            frame = latest[1]
+        return frame
+
+    def _watch(self):
+        while True:
+            published = self.ring.published()
+            if published != self._seen:
+                self._seen = published
+                with self.condition:
+                    self.condition.notify_all()
+            sleep(self.poll_interval)
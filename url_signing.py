@@ -0,0 +1,35 @@
+import hashlib
+import hmac
+from time import time
+from urllib.parse import quote
+from config import Config
+
+CAPTURE_URL_PREFIX = '/static/captures/'
+
+def _capture_key():
+    # Derived from SECRET_KEY so a capture signature can never be replayed as a session token
+    return hmac.new(Config.SECRET_KEY.encode('utf-8'), b'capture-url', hashlib.sha256).digest()
+
+def capture_signature(filename, expires):
+    message = f"{filename}\n{expires}".encode('utf-8')
+    return hmac.new(_capture_key(), message, hashlib.sha256).hexdigest()
+
+def sign_capture_url(filename, ttl=None):
+    """Return a short-lived URL for a file under IMAGE_DIR (captures and clips)"""
+    if ttl is None:
+        ttl = Config.CAPTURE_URL_TTL
+    expires = int(time()) + int(ttl)
+    return f"{CAPTURE_URL_PREFIX}{quote(filename)}?exp={expires}&sig={capture_signature(filename, expires)}"
+
+def verify_capture_signature(filename, expires, signature):
+    """Return the seconds the signature stays valid for, or 0 if it is invalid or expired"""
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return 0
+    remaining = expires - int(time())
+    if remaining <= 0 or not signature:
+        return 0
+    if not hmac.compare_digest(capture_signature(filename, expires), signature):
+        return 0
+    return remaining
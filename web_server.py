@@ -0,0 +1,420 @@
+import io
+import logging
+import queue
+import selectors
+import socket
+import sys
+import threading
+from time import monotonic
+from wsgiref.handlers import SimpleHandler
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler, make_server
+from config import Config
+from metrics import registry
+
+STREAM_PATHS = ('/video_feed', '/events')
+
+_BUSY_BODY = b'Server busy, retry shortly\n'
+_BUSY_RESPONSE = (b'HTTP/1.1 503 Service Unavailable\r\n'
+                  b'Content-Type: text/plain\r\n'
+                  b'Retry-After: 1\r\n'
+                  b'Connection: close\r\n'
+                  b'Content-Length: ' + str(len(_BUSY_BODY)).encode('ascii') + b'\r\n\r\n' + _BUSY_BODY)
+
+
+class WorkerPool(object):
+    """Fixed set of daemon threads fed from a queue. Unlike ThreadPoolExecutor,
+    a thread parked in an endless stream does not hold up interpreter exit."""
+
+    def __init__(self, size, name):
+        self.size = size
+        self.tasks = queue.SimpleQueue()
+        for i in range(size):
+            threading.Thread(target=self._run, name=f'{name}-{i + 1}', daemon=True).start()
+
+    def submit(self, func, *args):
+        self.tasks.put((func, args))
+
+    def pending(self):
+        return self.tasks.qsize()
+
+    def _run(self):
+        while True:
+            func, args = self.tasks.get()
+            if func is None:
+                return
+            try:
+                func(*args)
+            except Exception as e:
+                logging.getLogger('SecurityMonitor').error(f"Web worker Error: {str(e)}")
+
+    def shutdown(self):
+        for _ in range(self.size):
+            self.tasks.put((None, ()))
+
+
+class _ResponseWriter(SimpleHandler):
+    """wsgiref response writer speaking HTTP/1.1 to a keep-alive connection"""
+
+    http_version = '1.1'
+    origin_server = True
+    os_environ = {}  # do not leak the process environment into requests
+    completed = False
+    keep_alive = False
+
+    def cleanup_headers(self):
+        super().cleanup_headers()
+        if 'Content-Length' not in self.headers or not self.request.keep_alive:
+            self.headers['Connection'] = 'close'
+
+    def close(self):
+        # wsgiref clears status and headers here; remember what the request needs
+        self.completed = True
+        self.keep_alive = self.headers is not None and self.headers.get('Connection', '').lower() != 'close'
+        self.request.log_request(self.status.split(' ', 1)[0] if self.status else '-', self.bytes_sent)
+        super().close()
+
+
+class _DeadlineReader(socket.SocketIO):
+    """Socket reads bounded by handler.deadline while it is set, so a client
+    trickling its headers a byte at a time still gives up its thread on time"""
+
+    def __init__(self, sock, handler):
+        super().__init__(sock, 'rb')
+        self.handler = handler
+
+    def readinto(self, b):
+        deadline = self.handler.deadline
+        if deadline is not None:
+            self._sock.settimeout(max(0.001, deadline - monotonic()))
+        return super().readinto(b)
+
+
+class PooledRequestHandler(WSGIRequestHandler):
+    """One handler per connection, driven one request at a time by PoolServer
+    instead of looping over the connection in a thread of its own"""
+
+    protocol_version = 'HTTP/1.1'
+    streaming = False
+    requests = 0
+    deadline = None
+
+    def setup(self):
+        super().setup()
+        self.rfile = io.BufferedReader(_DeadlineReader(self.connection, self))
+
+    def handle(self):
+        self.close_connection = True
+        self.handoff = False
+        self.keep_alive = False
+
+    def finish(self):
+        pass
+
+    def parse_request(self):
+        ok = super().parse_request()
+        # Headers are in: the body and the response get the full request timeout
+        self.deadline = None
+        self.connection.settimeout(self.server.request_timeout)
+        if not ok:
+            return False
+        # What is left of a request body is unknown after the app has run,
+        # so only bodiless requests keep their connection
+        self.keep_alive = (not self.close_connection and 'Transfer-Encoding' not in self.headers
+                           and self.headers.get('Content-Length', '0') == '0')
+        if self.path.split('?', 1)[0] in self.server.stream_paths and not self.streaming:
+            # Stop here: PoolServer runs the rest on the stream pool
+            self.handoff = True
+            return False
+        return True
+
+    def run_wsgi(self):
+        """Werkzeug's run_wsgi always closes the connection and drains the
+        socket; this writes the response with wsgiref and closes only when
+        the response has no length or the request had a body"""
+        self.close_connection = True
+        environ = self.make_environ()
+        writer = _ResponseWriter(environ['wsgi.input'], self.wfile, sys.stderr, environ,
+                                 multithread=True, multiprocess=self.server.multiprocess)
+        writer.request = self
+        writer.run(self.server.app)
+        self.close_connection = not writer.keep_alive
+
+    def serve_one(self):
+        """Handle the next request; False once the connection should be closed"""
+        if self.requests:
+            self.server.reused += 1
+        self.requests += 1
+        self.deadline = monotonic() + self.server.header_timeout
+        try:
+            self.handle_one_request()
+        except (ConnectionError, socket.timeout) as e:
+            self.connection_dropped(e)
+            return False
+        finally:
+            self.deadline = None
+        return not self.close_connection
+
+    def close(self):
+        try:
+            super().finish()
+        except OSError:
+            pass
+        self.server.shutdown_request(self.request)
+
+
+class PoolServer(BaseWSGIServer):
+    """WSGI server with bounded threads and memory under load.
+
+    One selector thread accepts connections and parks idle keep-alive
+    connections, so they hold no thread. Requests run on a fixed pool;
+    /video_feed and /events are handed to a separate, capped stream pool so
+    viewers can never starve short requests. Past max_connections, or with
+    every stream slot taken, clients get an immediate 503 instead of a queue.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads=8, stream_threads=8, max_connections=64,
+                 keepalive_timeout=5.0, request_timeout=15.0, header_timeout=5.0,
+                 stream_paths=STREAM_PATHS, fd=None):
+        super().__init__(host, port, app, handler=PooledRequestHandler, fd=fd)
+        self.pool = WorkerPool(threads, 'WebWorker')
+        self.stream_pool = WorkerPool(stream_threads, 'WebStream')
+        self.stream_slots = threading.BoundedSemaphore(stream_threads)
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self.header_timeout = header_timeout
+        self.stream_paths = frozenset(stream_paths)
+        self.selector = selectors.DefaultSelector()
+        self.parked = {}  # socket -> (handler, idle since)
+        self.to_park = []
+        self.lock = threading.Lock()
+        self.wakeup_r, self.wakeup_w = socket.socketpair()
+        self.stopping = threading.Event()
+        self.stopped = threading.Event()
+        self.connections = 0
+        self.streams = 0
+        self.accepted = 0
+        self.reused = 0
+        self.rejected = {'connections': 0, 'streams': 0}
+        self.idle_closed = 0
+
+    def serve_forever(self, poll_interval=0.5):
+        # Worker processes may share this socket: whoever loses the race gets EAGAIN
+        self.socket.setblocking(False)
+        self.selector.register(self.socket, selectors.EVENT_READ, 'accept')
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ, 'wakeup')
+        try:
+            while not self.stopping.is_set():
+                for key, _ in self.selector.select(min(poll_interval, self.keepalive_timeout)):
+                    if key.data == 'accept':
+                        self._accept()
+                    elif key.data == 'wakeup':
+                        self._park_pending()
+                    else:
+                        self.selector.unregister(key.fileobj)
+                        handler, _ = self.parked.pop(key.fileobj)
+                        self.pool.submit(self._serve, handler)
+                self._close_idle()
+        finally:
+            for handler, _ in list(self.parked.values()):
+                self._close(handler)
+            self.parked.clear()
+            self.selector.close()
+            self.stopped.set()
+
+    def shutdown(self):
+        self.stopping.set()
+        self.wakeup_w.send(b'x')
+        self.stopped.wait()
+        self.pool.shutdown()
+        self.stream_pool.shutdown()
+
+    def _accept(self):
+        try:
+            sock, address = self.socket.accept()
+        except OSError:
+            return
+        with self.lock:
+            busy = self.connections >= self.max_connections
+            if not busy:
+                self.connections += 1
+        if busy:
+            self.rejected['connections'] += 1
+            self._reject(sock)
+            return
+        self.accepted += 1
+        sock.settimeout(self.request_timeout)
+        # Headers and body go out as separate writes: without this, Nagle and
+        # delayed ACKs add ~40 ms to every keep-alive request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            handler = PooledRequestHandler(sock, address, self)
+        except Exception as e:
+            self.log('error', f"Connection setup failed: {e}")
+            self._release(sock)
+            return
+        # Wait for the request line here, not on a worker thread
+        self.parked[sock] = (handler, monotonic())
+        self.selector.register(sock, selectors.EVENT_READ, handler)
+
+    def _reject(self, sock):
+        """Answer 503 without a thread: drain what has arrived, reply, close"""
+        try:
+            sock.setblocking(False)
+            try:
+                sock.recv(65536)
+            except BlockingIOError:
+                pass
+            sock.send(_BUSY_RESPONSE)
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        sock.close()
+
+    def _serve(self, handler):
+        """Run requests from one connection until it is idle, closed or a stream"""
+        while True:
+            try:
+                keep = handler.serve_one()
+            except Exception as e:
+                self.log('error', f"Request failed: {e}")
+                keep = False
+            if handler.handoff:
+                handler.handoff = False
+                self._start_stream(handler)
+                return
+            if not keep:
+                self._close(handler)
+                return
+            if not self._buffered(handler):
+                self._park(handler)
+                return
+            # A pipelined request is already buffered: serve it now
+
+    def _start_stream(self, handler):
+        if not self.stream_slots.acquire(blocking=False):
+            self.rejected['streams'] += 1
+            try:
+                handler.send_response(503)
+                handler.send_header('Content-Type', 'text/plain')
+                handler.send_header('Retry-After', '5')
+                handler.send_header('Content-Length', str(len(_BUSY_BODY)))
+                handler.send_header('Connection', 'close')
+                handler.end_headers()
+                handler.wfile.write(_BUSY_BODY)
+            except OSError:
+                pass
+            self._close(handler)
+            return
+        self.stream_pool.submit(self._stream, handler)
+
+    def _stream(self, handler):
+        with self.lock:
+            self.streams += 1
+        try:
+            handler.streaming = True
+            handler.run_wsgi()
+            handler.wfile.flush()
+        except (ConnectionError, socket.timeout) as e:
+            handler.connection_dropped(e)
+        except Exception as e:
+            self.log('error', f"Stream failed: {e}")
+        finally:
+            with self.lock:
+                self.streams -= 1
+            self.stream_slots.release()
+            self._close(handler)
+
+    def _buffered(self, handler):
+        """True if the client already sent more than the request just served"""
+        sock = handler.connection
+        try:
+            sock.setblocking(False)
+            return bool(handler.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            sock.settimeout(self.request_timeout)
+
+    def _park(self, handler):
+        with self.lock:
+            self.to_park.append(handler)
+        self.wakeup_w.send(b'x')
+
+    def _park_pending(self):
+        try:
+            self.wakeup_r.recv(4096)
+        except OSError:
+            pass
+        with self.lock:
+            pending, self.to_park = self.to_park, []
+        now = monotonic()
+        for handler in pending:
+            self.parked[handler.connection] = (handler, now)
+            self.selector.register(handler.connection, selectors.EVENT_READ, handler)
+
+    def _close_idle(self):
+        deadline = monotonic() - self.keepalive_timeout
+        for sock, (handler, since) in list(self.parked.items()):
+            if since < deadline:
+                self.selector.unregister(sock)
+                del self.parked[sock]
+                self.idle_closed += 1
+                self._close(handler)
+
+    def _close(self, handler):
+        handler.close()
+        with self.lock:
+            self.connections -= 1
+
+    def _release(self, sock):
+        self.shutdown_request(sock)
+        with self.lock:
+            self.connections -= 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'connections': self.connections,
+                'streams': self.streams,
+                'parked': len(self.parked),
+                'queued': self.pool.pending(),
+                'accepted': self.accepted,
+                'reused': self.reused,
+                'rejected': dict(self.rejected),
+                'idle_closed': self.idle_closed,
+            }
+
+
+def register_server_metrics(server):
+    registry.callback('security_http_connections', 'Open HTTP connections',
+                      lambda: server.stats()['connections'])
+    registry.callback('security_http_streams', 'Requests running on the stream pool',
+                      lambda: server.stats()['streams'])
+    registry.callback('security_http_keepalive_reused_total', 'Requests on a reused keep-alive connection',
+                      lambda: server.stats()['reused'], 'counter')
+    registry.callback('security_http_rejected_total', 'Requests answered 503 because the server was full',
+                      lambda: {(('reason', reason),): n for reason, n in server.stats()['rejected'].items()},
+                      'counter')
+
+
+def serve(app, host='0.0.0.0', port=5000, fd=None):
+    """Serve app with the server selected by WEB_SERVER until the process exits"""
+    if Config.WEB_SERVER == 'pool':
+        server = PoolServer(host, port, app,
+                            threads=Config.WEB_THREADS,
+                            stream_threads=Config.WEB_STREAM_THREADS,
+                            max_connections=Config.WEB_MAX_CONNECTIONS,
+                            keepalive_timeout=Config.WEB_KEEPALIVE_TIMEOUT,
+                            request_timeout=Config.WEB_REQUEST_TIMEOUT,
+                            header_timeout=Config.WEB_HEADER_TIMEOUT,
+                            fd=fd)
+        register_server_metrics(server)
+        logging.getLogger('SecurityMonitor').info(
+            f"Serving on {host}:{port} with {Config.WEB_THREADS} request threads, "
+            f"{Config.WEB_STREAM_THREADS} stream threads, {Config.WEB_MAX_CONNECTIONS} connections max")
+    else:
+        server = make_server(host, port, app, threaded=True, fd=fd)
+    server.serve_forever()